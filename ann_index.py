@@ -0,0 +1,220 @@
+# ann_index.py
+import os
+import time
+import numpy as np
+
+class IVFIndex:
+    def __init__(self, dim=128, nlist=64, nprobe=8):
+        """Inverted-file (k-means partitioned) approximate nearest neighbour index"""
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.centroids = None
+        self._lists = []
+        self._where = {}
+
+    def __len__(self):
+        return len(self._where)
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def _nearest_centroids(self, vectors, count=1):
+        """Return the indices of the closest centroids for each row"""
+        c_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        d2 = c_norms[None, :] - 2.0 * (vectors @ self.centroids.T)
+        if count == 1:
+            return np.argmin(d2, axis=1)
+        count = min(count, len(self.centroids))
+        part = np.argpartition(d2, count - 1, axis=1)[:, :count]
+        return part
+
+    def train(self, vectors, iters=10, seed=0, max_per_list=256):
+        """Learn centroids with k-means on (a sample of) the given vectors"""
+        x = np.ascontiguousarray(vectors, dtype=np.float32)
+        rng = np.random.default_rng(seed)
+        k = max(1, min(self.nlist, len(x)))
+        if len(x) > k * max_per_list:
+            x = x[rng.choice(len(x), k * max_per_list, replace=False)]
+
+        self.centroids = x[rng.choice(len(x), k, replace=False)].copy()
+        for _ in range(iters):
+            assign = self._nearest_centroids(x)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assign, x)
+            counts = np.bincount(assign, minlength=k)
+            empty = counts == 0
+            self.centroids[~empty] = sums[~empty] / counts[~empty, None]
+            # Reseed empty partitions so every list stays useful
+            if empty.any():
+                self.centroids[empty] = x[rng.choice(len(x), int(empty.sum()), replace=False)]
+        self.nlist = k
+        self._lists = [[np.empty(0, dtype=np.int64), np.empty((0, self.dim), dtype=np.float32), 0]
+                       for _ in range(k)]
+        self._where = {}
+
+    def build(self, ids, vectors, iters=10, seed=0):
+        """Train on and insert a full set of vectors"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            self.centroids = None
+            self._lists = []
+            self._where = {}
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        self.train(vectors, iters=iters, seed=seed)
+        assign = self._nearest_centroids(vectors)
+        order = np.argsort(assign, kind='stable')
+        bounds = np.searchsorted(assign[order], np.arange(self.nlist + 1))
+        for j in range(self.nlist):
+            sel = order[bounds[j]:bounds[j + 1]]
+            list_ids = ids[sel]
+            self._lists[j] = [list_ids, vectors[sel].copy(), len(sel)]
+            for pos, uid in enumerate(list_ids):
+                self._where[int(uid)] = (j, pos)
+
+    def add(self, item_id, vector):
+        """Insert one vector into its nearest partition"""
+        if not self.is_trained:
+            raise RuntimeError("IVF index must be trained before add()")
+        if item_id in self._where:
+            self.remove(item_id)
+        vec = np.asarray(vector, dtype=np.float32).reshape(1, self.dim)
+        j = int(self._nearest_centroids(vec)[0])
+        entry = self._lists[j]
+        list_ids, vecs, size = entry
+        if size == len(list_ids):
+            capacity = max(8, size * 2)
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_ids[:size] = list_ids[:size]
+            grown_vecs = np.empty((capacity, self.dim), dtype=np.float32)
+            grown_vecs[:size] = vecs[:size]
+            entry[0], entry[1] = list_ids, vecs = grown_ids, grown_vecs
+        list_ids[size] = item_id
+        vecs[size] = vec[0]
+        entry[2] = size + 1
+        self._where[item_id] = (j, size)
+
+    def remove(self, item_id):
+        """Remove one vector by moving the partition's last row into its slot"""
+        loc = self._where.pop(item_id, None)
+        if loc is None:
+            return False
+        j, pos = loc
+        entry = self._lists[j]
+        list_ids, vecs, size = entry
+        last = size - 1
+        if pos != last:
+            list_ids[pos] = list_ids[last]
+            vecs[pos] = vecs[last]
+            self._where[int(list_ids[pos])] = (j, pos)
+        entry[2] = last
+        return True
+
+    def search(self, query, k=1, nprobe=None):
+        """Return (ids, distances) of the k approximate nearest neighbours"""
+        if not self.is_trained or not self._where:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        q = np.asarray(query, dtype=np.float32).reshape(1, self.dim)
+        probes = self._nearest_centroids(q, nprobe or self.nprobe)[0]
+        cand_ids = [self._lists[j][0][:self._lists[j][2]] for j in np.atleast_1d(probes)]
+        cand_vecs = [self._lists[j][1][:self._lists[j][2]] for j in np.atleast_1d(probes)]
+        cand_ids = np.concatenate(cand_ids)
+        if len(cand_ids) == 0:
+            return cand_ids, np.empty(0, dtype=np.float32)
+        cand_vecs = np.concatenate(cand_vecs)
+        dist = np.sqrt(np.maximum(np.einsum('ij,ij->i', cand_vecs - q, cand_vecs - q), 0.0))
+        k = min(k, len(dist))
+        top = np.argpartition(dist, k - 1)[:k]
+        top = top[np.argsort(dist[top])]
+        return cand_ids[top], dist[top]
+
+    def ids(self):
+        return set(self._where)
+
+    def snapshot(self):
+        """Copy of the persisted arrays, so save() can write them while the index keeps changing"""
+        ids = np.concatenate([e[0][:e[2]] for e in self._lists]) if self._lists else np.empty(0, dtype=np.int64)
+        vecs = (np.concatenate([e[1][:e[2]] for e in self._lists])
+                if self._lists else np.empty((0, self.dim), dtype=np.float32))
+        sizes = np.array([e[2] for e in self._lists], dtype=np.int64)
+        centroids = self.centroids.copy() if self.is_trained else np.empty((0, self.dim), dtype=np.float32)
+        return dict(centroids=centroids, ids=ids, vectors=vecs, sizes=sizes, nprobe=np.int64(self.nprobe))
+
+    def save(self, path, snapshot=None):
+        """Persist centroids and partitions atomically"""
+        snapshot = self.snapshot() if snapshot is None else snapshot
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **snapshot)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index written by save()"""
+        with np.load(path) as data:
+            centroids = data['centroids']
+            index = cls(dim=centroids.shape[1], nlist=max(1, len(centroids)), nprobe=int(data['nprobe']))
+            if len(centroids) == 0:
+                return index
+            index.centroids = centroids.astype(np.float32)
+            ids, vecs, sizes = data['ids'], data['vectors'], data['sizes']
+        offsets = np.concatenate([[0], np.cumsum(sizes)])
+        index._lists = []
+        for j in range(len(sizes)):
+            list_ids = ids[offsets[j]:offsets[j + 1]].copy()
+            index._lists.append([list_ids, vecs[offsets[j]:offsets[j + 1]].copy(), int(sizes[j])])
+            for pos, uid in enumerate(list_ids):
+                index._where[int(uid)] = (j, pos)
+        return index
+
+def suggested_nlist(count):
+    """Rule of thumb partition count for a gallery of the given size"""
+    return int(max(1, min(4096, 4 * np.sqrt(max(count, 1)))))
+
+def benchmark(count=100000, queries=500, dim=128, nprobes=(1, 4, 8, 16, 32), seed=0):
+    """Compare recall@1 and latency of the IVF index against exact search"""
+    from face_gallery import FaceGallery
+
+    rng = np.random.default_rng(seed)
+    # Clustered synthetic encodings roughly shaped like dlib face descriptors
+    centers = rng.normal(0, 0.1, size=(max(1, count // 50), dim)).astype(np.float32)
+    data = centers[rng.integers(0, len(centers), count)] + rng.normal(0, 0.05, size=(count, dim)).astype(np.float32)
+    picks = rng.integers(0, count, queries)
+    probes = data[picks] + rng.normal(0, 0.02, size=(queries, dim)).astype(np.float32)
+
+    gallery = FaceGallery(dim=dim)
+    for i in range(count):
+        gallery.add(i, str(i), data[i])
+
+    exact_ids = np.empty(queries, dtype=np.int64)
+    timings = []
+    for qi, q in enumerate(probes):
+        start = time.perf_counter()
+        ids, _, dist = gallery.distances(q)
+        exact_ids[qi] = ids[int(np.argmin(dist))]
+        timings.append(time.perf_counter() - start)
+    timings = np.array(timings) * 1000
+    print(f"exact     : recall=1.000 mean={timings.mean():.3f}ms p99={np.percentile(timings, 99):.3f}ms")
+
+    index = IVFIndex(dim=dim, nlist=suggested_nlist(count))
+    start = time.perf_counter()
+    index.build(np.arange(count), data)
+    print(f"IVF build : nlist={index.nlist} {time.perf_counter() - start:.2f}s")
+
+    for nprobe in nprobes:
+        hits = 0
+        timings = []
+        for qi, q in enumerate(probes):
+            start = time.perf_counter()
+            ids, _ = index.search(q, k=1, nprobe=nprobe)
+            timings.append(time.perf_counter() - start)
+            hits += int(len(ids) > 0 and ids[0] == exact_ids[qi])
+        timings = np.array(timings) * 1000
+        print(f"nprobe={nprobe:<3}: recall={hits / queries:.3f} mean={timings.mean():.3f}ms "
+              f"p99={np.percentile(timings, 99):.3f}ms")
+
+if __name__ == "__main__":
+    import sys
+    benchmark(count=int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
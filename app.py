@@ -1,300 +1,554 @@
-from flask import Flask, render_template, request, jsonify, Response
+from flask import Flask, render_template, request, jsonify, Response, abort
 import sqlite3
 from datetime import datetime, timedelta
-import pickle
-import cv2
-import face_recognition
-from rfid_module import RFIDReader
-from face_recognition_module import FaceRecognitionSystem
+from face_gallery import FaceGallery
+from encoding_format import encode_encoding, decode_encoding
+from job_scheduler import QueueFull
+from station import Station, Components
+from status_stream import StatusBroadcaster
+from db_pool import ConnectionPool
+from database_setup import apply_migrations
+from pagination import parse_listing_args, build_keyset_query, stream_page
+import queries
+from queries import BOOK_SORTS, USER_SORTS, TRANSACTION_SORTS
+import bulk_io
+from query_cache import QueryCache
+from audit_log import AuditWriter
+from metrics import registry
+from vision_pool import VisionPool
+from patron_session import SessionCache, box_overlap
+from due_scheduler import DueDateScheduler
+from capture_archive import CaptureArchiver
+import io
+import itertools
+import re
+import os
 import threading
 import time
 
 app = Flask(__name__)
 
 lms_instance = None
-operation_status = {"status": "idle", "message": "System Ready"}
+lms_lock = threading.Lock()
+status_events = StatusBroadcaster()
 
 class LibraryManagementSystem:
-    def __init__(self):
-        self.db_name = 'library_management.db'
-        self.rfid_reader = RFIDReader()
-        self.face_system = FaceRecognitionSystem()
+    def __init__(self, use_ann_index=None, ann_nprobe=None, video_fps=15, video_size=None, video_quality=80,
+                 burst_size=3, match_tolerance=0.6, db_name='library_management.db', camera=None, rfid_reader=None,
+                 stations=None, vision_workers=None, session_ttl=60.0, capture_quality=85, capture_max_mb=256,
+                 capture_max_days=365):
+        """Open the database only; call start() to bring up models and devices without blocking requests.
+        stations maps station IDs to {"camera": driver, "rfid_reader": driver}; by default the IDs come from
+        LMS_STATIONS (e.g. desk1,desk2) or a single 'default' station using camera and rfid_reader.
+        use_ann_index and ann_nprobe default to LMS_ANN_INDEX (1 to enable) and LMS_ANN_NPROBE (8).
+        vision_workers processes run face detection and encoding (default LMS_VISION_WORKERS, else one per
+        core but one; 0 keeps them in the web process). A patron identified at a station is recognised again
+        without a full scan for session_ttl seconds after each scan (0 disables sessions). Face crops kept as
+        issue/return evidence in face_images are bounded by capture_max_mb and capture_max_days"""
+        self.db_name = db_name
+        self.db_pool = ConnectionPool(self.db_name)
+        self.search_cache = QueryCache()
+        self.audit = AuditWriter(self.get_connection)
+        self.archiver = CaptureArchiver(self.get_connection, quality=capture_quality,
+                                        max_bytes=capture_max_mb * 1024 * 1024, max_age_days=capture_max_days)
+        self.burst_size = burst_size
+        self.match_tolerance = match_tolerance
+        self.sessions = SessionCache(ttl=session_ttl)
+        self.session_check_timeout = 2.0
+        self.session_min_overlap = 0.3
+        # Stricter than match_tolerance: a session is confirmed from one frame instead of a fused burst
+        self.session_tolerance = 0.45
+        self.gallery = FaceGallery()
+        if use_ann_index is None:
+            use_ann_index = os.environ.get('LMS_ANN_INDEX', '').strip().lower() in ('1', 'true', 'yes', 'on')
+        if ann_nprobe is None:
+            ann_nprobe = int(os.environ.get('LMS_ANN_NPROBE', 8))
+        if use_ann_index:
+            # Approximate search for very large galleries; raise nprobe for recall, lower it for latency
+            self.gallery.enable_ann(os.path.splitext(self.db_name)[0] + '.ivf.npz', nprobe=ann_nprobe)
+        conn = self.get_connection()
+        apply_migrations(conn)
+        conn.close()
+        self.due_dates = DueDateScheduler(self.get_connection, self.audit)
+        
+        # One process pool shared by all stations keeps dlib work off the web server's GIL
+        if vision_workers is None:
+            vision_workers = int(os.environ.get('LMS_VISION_WORKERS', max(0, (os.cpu_count() or 1) - 1)))
+        self.vision_pool = VisionPool(vision_workers) if vision_workers > 0 else None
+        
+        if stations is None:
+            station_ids = [s.strip() for s in os.environ.get('LMS_STATIONS', '').split(',') if s.strip()]
+            stations = {sid: {} for sid in station_ids} or {'default': {"camera": camera, "rfid_reader": rfid_reader}}
+        # Every station gets its own devices and job lane; job ids stay unique across lanes
+        job_ids = itertools.count(1)
+        video_options = {"fps": video_fps, "size": video_size, "quality": video_quality}
+        self.stations = {sid: Station(sid, video_options=video_options, job_ids=job_ids, vision_pool=self.vision_pool,
+                                      archiver=self.archiver, **devices)
+                         for sid, devices in stations.items()}
+        self.default_station = next(iter(self.stations.values()))
+        
+        # Shared by all stations; each station adds its own camera and RFID reader
+        self.components = Components(('gallery', 'models'))
+        self._start_lock = threading.Lock()
+        self._started = False
+        registry.collectors.append(self.collect_metrics)
+    
+    def start(self):
+        """Load the gallery and warm the face models while every station opens its devices, all in parallel"""
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+        self.components.start('gallery', self._init_gallery)
+        self.components.start('models', self._init_models)
+        self.due_dates.start()
+        for station in self.stations.values():
+            station.start()
+    
+    def _init_gallery(self):
+        conn = self.get_connection()
+        try:
+            self.gallery.load(conn)
+        finally:
+            conn.close()
+    
+    def _init_models(self):
+        # With a vision pool all dlib work, the pose gate's landmarks included, runs in its workers, so the
+        # models are only loaded there. Otherwise importing face_recognition loads them here, and one pass on
+        # a blank frame warms them up
+        if self.vision_pool is not None:
+            self.vision_pool.warm()
+            return
+        import face_recognition
+        import numpy as np
+        blank = np.zeros((160, 160, 3), np.uint8)
+        face_recognition.face_locations(blank)
+        face_recognition.face_encodings(blank, [(20, 140, 140, 20)])
+    
+    def get_station(self, station_id=None):
+        """The named station, or the first configured one when station_id is None"""
+        if station_id is None:
+            return self.default_station
+        return self.stations.get(station_id)
+    
+    def wait_ready(self, timeout=None):
+        """Block until shared components and all stations finished starting; True if everything came up"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+        ready = self.components.wait_ready(timeout=remaining())
+        for station in self.stations.values():
+            ready = station.components.wait_ready(timeout=remaining()) and ready
+        return ready
+    
+    def is_ready(self):
+        return self.components.is_ready() and all(s.components.is_ready() for s in self.stations.values())
+    
+    def get_job(self, job_id):
+        for station in self.stations.values():
+            job = station.scheduler.get(job_id)
+            if job is not None:
+                return job
+        return None
+    
+    def collect_metrics(self):
+        """Gauges read at scrape time from the stations, connection pool and caches"""
+        ready = [({"component": name}, int(state["state"] == "ready")) for name, state in self.components.state.items()]
+        families = []
+        for station in self.stations.values():
+            labels = {"station": station.id}
+            ready += [({"component": name, **labels}, int(state["state"] == "ready"))
+                      for name, state in station.components.state.items()]
+            families.append(('lms_job_queue_depth', 'gauge', [(labels, station.scheduler.queue_depth)]))
+            if station.face_system is None:
+                continue
+            stream = station.face_system.stream
+            latest = stream.latest()
+            families += [
+                ('lms_camera_fps', 'gauge', [(labels, round(stream.fps, 2))]),
+                ('lms_camera_frame_age_seconds', 'gauge',
+                 [(labels, round(time.monotonic() - latest[1], 3) if latest else -1)]),
+                ('lms_camera_errors_total', 'counter', [(labels, stream.errors)]),
+                ('lms_video_frames_encoded_total', 'counter', [(labels, station.broadcaster.frames_encoded)]),
+                ('lms_video_subscribers', 'gauge', [(labels, station.broadcaster.subscriber_count)]),
+            ]
+        families.append(('lms_component_ready', 'gauge', ready))
+        if self.vision_pool is not None:
+            families.append(('lms_vision_pool_in_flight', 'gauge', [({}, self.vision_pool.in_flight)]))
+        pool = self.db_pool.stats()
+        search = self.search_cache.stats()
+        sessions = self.sessions.stats()
+        return families + [
+            ('lms_db_pool_connections', 'gauge', [({"state": "idle"}, pool["idle"]),
+                                                  ({"state": "in_use"}, pool["in_use"])]),
+            ('lms_db_pool_checkouts_total', 'counter', [({}, pool["checkouts"])]),
+            ('lms_db_pool_waits_total', 'counter', [({}, pool["waits"])]),
+            ('lms_db_pool_wait_seconds_total', 'counter', [({}, round(pool["wait_ms_total"] / 1000.0, 6))]),
+            ('lms_search_cache_requests_total', 'counter', [({"result": "hit"}, search["hits"]),
+                                                            ({"result": "miss"}, search["misses"])]),
+            ('lms_gallery_size', 'gauge', [({}, len(self.gallery))]),
+            ('lms_patron_sessions', 'gauge', [({}, sessions["active"])]),
+            ('lms_due_events_scheduled', 'gauge', [({}, len(self.due_dates))]),
+            ('lms_patron_session_checks_total', 'counter', [({"result": "reused"}, sessions["hits"]),
+                                                            ({"result": "rejected"}, sessions["misses"])]),
+            ('lms_audit_queue_depth', 'gauge', [({}, self.audit.queue_depth)]),
+            ('lms_capture_archive_queue_depth', 'gauge', [({}, self.archiver.queue_depth)]),
+            ('lms_capture_archive_bytes', 'gauge', [({}, self.archiver.disk_bytes)]),
+            ('lms_capture_archive_images_total', 'counter', [({"result": "written"}, self.archiver.written),
+                                                             ({"result": "dropped"}, self.archiver.dropped),
+                                                             ({"result": "evicted"}, self.archiver.evicted)]),
+            ('lms_audit_events_total', 'counter', [({"result": "written"}, self.audit.written),
+                                                   ({"result": "dropped"}, self.audit.dropped)]),
+        ]
     
     def get_connection(self):
-        return sqlite3.connect(self.db_name)
+        return self.db_pool.connection()
     
-    def register_book(self, title, author, isbn, category):
-        global operation_status
-        operation_status = {"status": "reading_rfid", "message": "Place book on RFID reader..."}
+    def register_book(self, job, station, title, author, isbn, category):
+        job.update("reading_rfid", "Place book on RFID reader...")
         
-        rfid_tag, _ = self.rfid_reader.read_rfid()
+        with registry.timer('rfid_read'):
+            rfid_tag, _ = station.rfid_reader.read_rfid()
         if not rfid_tag:
-            operation_status = {"status": "error", "message": "Failed to read RFID!"}
+            job.update("error", "Failed to read RFID!")
+            self.audit.log("rfid_failed", job_id=job.id, station=station.id, operation="register_book")
             return
         
-        self.rfid_reader.write_rfid(f"{title}|{author}")
+        with registry.timer('rfid_write'):
+            station.rfid_reader.write_rfid(f"{title}|{author}")
         
         conn = self.get_connection()
         cur = conn.cursor()
         try:
-            cur.execute('INSERT INTO books (rfid_tag, title, author, isbn, category) VALUES (?, ?, ?, ?, ?)',
-                       (rfid_tag, title, author, isbn, category))
-            conn.commit()
-            operation_status = {"status": "success", "message": f"Book registered! ID: {cur.lastrowid}"}
+            with registry.timer('db_commit'):
+                cur.execute('INSERT INTO books (rfid_tag, title, author, isbn, category) VALUES (?, ?, ?, ?, ?)',
+                           (rfid_tag, title, author, isbn, category))
+                conn.commit()
+            self.search_cache.invalidate()
+            job.update("success", f"Book registered! ID: {cur.lastrowid}")
+            self.audit.log("book_registered", job_id=job.id, book_id=cur.lastrowid, rfid_tag=rfid_tag)
         except sqlite3.IntegrityError:
-            operation_status = {"status": "error", "message": "RFID already registered!"}
+            job.update("error", "RFID already registered!")
+            self.audit.log("register_failed", job_id=job.id, rfid_tag=rfid_tag, reason="duplicate_rfid")
         finally:
             conn.close()
     
-    def register_user(self, name, email, phone):
-        global operation_status
+    def register_user(self, job, station, name, email, phone):
         try:
-            operation_status = {"status": "capturing_face", "message": "Look at camera..."}
+            job.update("capturing_face", "Look at camera...")
             print(f"Registering user: {name}")
             
-            time.sleep(2)
-            
-            # Capture image
-            print("Capturing image...")
-            frame_array = self.face_system.picam2.capture_array()
-            
-            # Convert RGB to BGR for face_recognition
-            frame_rgb = cv2.cvtColor(frame_array, cv2.COLOR_BGR2RGB)
-            
-            # Detect faces
-            print("Detecting faces...")
-            face_locations = face_recognition.face_locations(frame_rgb)
-            print(f"Found {len(face_locations)} faces")
-            
-            if len(face_locations) == 0:
-                operation_status = {"status": "error", "message": "No face detected!"}
-                print("No face detected!")
-                time.sleep(3)
-                return
-            
-            if len(face_locations) > 1:
-                operation_status = {"status": "error", "message": "Multiple faces detected!"}
-                print("Multiple faces detected!")
-                time.sleep(3)
+            # Capture a burst as soon as one usable face is in view
+            print("Waiting for face...")
+            with registry.timer('capture_burst'):
+                captures, reason = station.face_system.capture_burst(self.burst_size)
+            if reason:
+                job.update("error", station.face_system.capture_messages[reason])
+                print(station.face_system.capture_messages[reason])
                 return
             
             # Get face encoding
             print("Encoding face...")
-            face_encodings = face_recognition.face_encodings(frame_rgb, face_locations)
+            with registry.timer('encode_burst'):
+                face_encodings = station.face_system.encode_burst(captures)
             
-            if not face_encodings:
-                operation_status = {"status": "error", "message": "Failed to encode face!"}
+            if len(face_encodings) == 0:
+                job.update("error", "Failed to encode face!")
                 print("Failed to encode face!")
-                time.sleep(3)
                 return
             
-            encoding = face_encodings[0]
-            print("Face encoded successfully!")
+            encoding, inliers = station.face_system.robust_template(face_encodings)
+            print(f"Face encoded successfully from {inliers}/{len(face_encodings)} frames!")
             
             conn = self.get_connection()
             cur = conn.cursor()
             try:
-                cur.execute('INSERT INTO users (name, email, phone, face_encoding) VALUES (?, ?, ?, ?)',
-                           (name, email, phone, pickle.dumps(encoding)))
-                conn.commit()
-                operation_status = {"status": "success", "message": f"User {name} registered!"}
+                with registry.timer('db_commit'):
+                    cur.execute('INSERT INTO users (name, email, phone, face_encoding) VALUES (?, ?, ?, ?)',
+                               (name, email, phone, encode_encoding(encoding)))
+                    conn.commit()
+                self.gallery.add(cur.lastrowid, name, encoding)
+                self.gallery.save_ann()
+                job.update("success", f"User {name} registered!")
                 print(f"User {name} registered successfully!")
-                time.sleep(3)
+                self.audit.log("user_registered", job_id=job.id, user_id=cur.lastrowid, frames=len(face_encodings),
+                               inliers=inliers)
             except sqlite3.IntegrityError:
-                operation_status = {"status": "error", "message": "Email exists!"}
+                job.update("error", "Email exists!")
                 print("Email already exists!")
-                time.sleep(3)
+                self.audit.log("register_failed", job_id=job.id, reason="duplicate_email")
             finally:
                 conn.close()
         except Exception as e:
-            operation_status = {"status": "error", "message": f"Error: {str(e)}"}
+            job.update("error", f"Error: {str(e)}")
             print(f"Registration error: {e}")
-            time.sleep(3)
+            self.audit.log("register_failed", job_id=job.id, reason="exception", error=str(e))
+    
+    def identify_patron(self, job, station):
+        """Return (user_id, user_name, (frame_rgb, face_location), None) for the patron at the station's camera,
+        or (None, None, None, reason) after reporting the failure on the job. A patron identified at this station moments ago is only
+        re-confirmed with one frame against their own template instead of a burst and a gallery scan"""
+        session = self.sessions.get(station.id)
+        if session is not None:
+            job.update("identifying", f"Confirming {session.user_name}...")
+            with registry.timer('session_check'):
+                capture = self._confirm_session(station, session)
+            if capture is not None:
+                self.sessions.confirmed(station.id, capture[1])
+                self.audit.log("session_reuse", job_id=job.id, station=station.id, user_id=session.user_id)
+                return session.user_id, session.user_name, capture, None
+            self.sessions.reject(station.id)
+        
+        job.update("identifying", "Look at camera...")
+        with registry.timer('capture_burst'):
+            captures, reason = station.face_system.capture_burst(self.burst_size)
+        if reason:
+            job.update("error", station.face_system.capture_messages[reason])
+            return None, None, None, reason
+        
+        with registry.timer('encode_burst'):
+            face_encodings = station.face_system.encode_burst(captures)
+        if len(face_encodings) == 0:
+            job.update("error", "Failed to encode face!")
+            return None, None, None, "encode_failed"
+        
+        with registry.timer('gallery_match'):
+            encoding, _ = station.face_system.robust_template(face_encodings)
+            match = self.gallery.best_match(encoding, tolerance=self.match_tolerance)
+        if not match:
+            job.update("error", "User not recognized!")
+            self.audit.log("face_unmatched", job_id=job.id, station=station.id, frames=len(face_encodings),
+                           gallery_size=len(self.gallery))
+            return None, None, None, "not_recognized"
+        
+        user_id, user_name, distance = match
+        self.audit.log("face_match", job_id=job.id, station=station.id, user_id=user_id,
+                       distance=round(float(distance), 4), frames=len(face_encodings), gallery_size=len(self.gallery))
+        self.sessions.start(station.id, user_id, user_name, encoding, captures[-1][1])
+        return user_id, user_name, captures[-1], None
+    
+    def _confirm_session(self, station, session):
+        """(frame_rgb, face_location) if the face in view continues the session's track, is close to its
+        template and is still closest to the session's user in the whole gallery, else None"""
+        # Detect on the full frame; the ROI left over from the previous job says nothing about where the patron is now
+        frame_rgb, face_location, reason = station.face_system.wait_for_face(timeout=self.session_check_timeout)
+        if reason or box_overlap(face_location, session.face_location) < self.session_min_overlap:
+            return None
+        encodings = station.face_system.encode_burst([(frame_rgb, face_location)])
+        if len(encodings) == 0 or station.face_system.fused_distance(session.template, encodings) > self.session_tolerance:
+            return None
+        # A relative queuing behind the patron may be within tolerance of them; the 1:N search picks whoever
+        # is closest, so only reuse the session when that is still the session's user
+        with registry.timer('gallery_match'):
+            match = self.gallery.best_match(encodings[0], tolerance=self.match_tolerance)
+        if match is None or match[0] != session.user_id:
+            return None
+        return frame_rgb, face_location
     
-    def issue_book(self):
-        global operation_status
+    def issue_book(self, job, station):
         try:
-            operation_status = {"status": "reading_rfid", "message": "Reading RFID..."}
-            print("Issue Book: Reading RFID...")
+            job.update("reading_rfid", "Reading RFID...")
             
-            rfid_tag, _ = self.rfid_reader.read_rfid()
+            with registry.timer('rfid_read'):
+                rfid_tag, _ = station.rfid_reader.read_rfid()
             if not rfid_tag:
-                operation_status = {"status": "error", "message": "RFID read failed!"}
+                job.update("error", "RFID read failed!")
+                self.audit.log("rfid_failed", job_id=job.id, station=station.id, operation="issue")
                 return
+            self.audit.log("rfid_read", job_id=job.id, station=station.id, operation="issue", rfid_tag=rfid_tag)
             
             conn = self.get_connection()
             cur = conn.cursor()
-            cur.execute('SELECT book_id, title, status FROM books WHERE rfid_tag=?', (rfid_tag,))
-            book = cur.fetchone()
+            with registry.timer('db_lookup'):
+                cur.execute(queries.ISSUE_LOOKUP, (rfid_tag,))
+                book = cur.fetchone()
             
             if not book or book[2] != 'available':
-                operation_status = {"status": "error", "message": "Book unavailable!"}
+                job.update("error", "Book unavailable!")
+                self.audit.log("issue_failed", job_id=job.id, rfid_tag=rfid_tag, reason="book_unavailable",
+                               book_id=book[0] if book else None)
                 conn.close()
                 return
             
-            print(f"Book found: {book[1]}")
-            
-            operation_status = {"status": "identifying", "message": "Look at camera..."}
-            print("Identifying user...")
-            time.sleep(2)
-            
-            # Capture and identify
-            frame_array = self.face_system.picam2.capture_array()
-            frame_rgb = cv2.cvtColor(frame_array, cv2.COLOR_BGR2RGB)
-            
-            face_locations = face_recognition.face_locations(frame_rgb)
-            print(f"Found {len(face_locations)} faces")
-            
-            if len(face_locations) == 0:
-                operation_status = {"status": "error", "message": "No face detected!"}
-                print("No face detected!")
-                time.sleep(3)
-                conn.close()
-                return
-            
-            face_encodings = face_recognition.face_encodings(frame_rgb, face_locations)
-            
-            if not face_encodings:
-                operation_status = {"status": "error", "message": "Failed to encode face!"}
-                print("Failed to encode face!")
-                time.sleep(3)
+            user_id, user_name, capture, reason = self.identify_patron(job, station)
+            if reason:
+                self.audit.log("issue_failed", job_id=job.id, book_id=book[0], reason=reason)
                 conn.close()
                 return
             
-            encoding = face_encodings[0]
-            
-            cur.execute('SELECT user_id, name, face_encoding FROM users WHERE is_active=1')
-            users = cur.fetchall()
-            
-            user_id = None
-            user_name = None
-            
-            print(f"Comparing with {len(users)} users...")
-            for uid, uname, enc in users:
-                known_encoding = pickle.loads(enc)
-                matches = face_recognition.compare_faces([known_encoding], encoding, tolerance=0.6)
-                distance = face_recognition.face_distance([known_encoding], encoding)
-                print(f"User {uname}: match={matches[0]}, distance={distance[0]}")
-                
-                if matches[0]:
-                    user_id = uid
-                    user_name = uname
-                    break
-            
-            if not user_id:
-                operation_status = {"status": "error", "message": "User not recognized!"}
-                print("User not recognized!")
-                time.sleep(3)
-                conn.close()
-                return
-            
-            print(f"User recognized: {user_name}")
-            operation_status = {"status": "processing", "message": f"Issuing to {user_name}..."}
+            job.update("processing", f"Issuing to {user_name}...")
             
             issue_date = datetime.now()
             due_date = issue_date + timedelta(days=14)
             
-            cur.execute('INSERT INTO transactions (book_id, user_id, rfid_tag, issue_date, due_date, status) VALUES (?, ?, ?, ?, ?, ?)',
-                       (book[0], user_id, rfid_tag, issue_date.strftime('%Y-%m-%d %H:%M:%S'),
-                        due_date.strftime('%Y-%m-%d %H:%M:%S'), 'issued'))
-            cur.execute('UPDATE books SET status=? WHERE book_id=?', ('issued', book[0]))
-            conn.commit()
+            with registry.timer('db_commit'):
+                cur.execute('INSERT INTO transactions (book_id, user_id, rfid_tag, issue_date, due_date, status) VALUES (?, ?, ?, ?, ?, ?)',
+                           (book[0], user_id, rfid_tag, issue_date.strftime('%Y-%m-%d %H:%M:%S'),
+                            due_date.strftime('%Y-%m-%d %H:%M:%S'), 'issued'))
+                transaction_id = cur.lastrowid
+                cur.execute('UPDATE books SET status=? WHERE book_id=?', ('issued', book[0]))
+                conn.commit()
             conn.close()
+            self.due_dates.schedule(transaction_id, due_date.strftime('%Y-%m-%d %H:%M:%S'))
+            self.archiver.archive_capture(capture, transaction_ids=[transaction_id], kind='issue')
+            self.search_cache.invalidate()
+            self.audit.log("issued", transaction_id, job_id=job.id, book_id=book[0], user_id=user_id)
             
-            operation_status = {"status": "success", "message": f"Book '{book[1]}' issued to {user_name}!"}
-            print(f"Book issued successfully to {user_name}")
-            time.sleep(3)
+            job.update("success", f"Book '{book[1]}' issued to {user_name}!")
         except Exception as e:
-            operation_status = {"status": "error", "message": f"Error: {str(e)}"}
+            job.update("error", f"Error: {str(e)}")
             print(f"Issue error: {e}")
-            time.sleep(3)
+            self.audit.log("issue_failed", job_id=job.id, reason="exception", error=str(e))
+    
+    def issue_books(self, job, station, count):
+        """Issue a stack of up to count books to one patron: scan the tags, identify once and record every
+        loan in a single transaction. A read timeout ends the stack early"""
+        try:
+            tags = []
+            for i in range(count):
+                job.update("reading_rfid", f"Scan book {i + 1} of {count}...")
+                with registry.timer('rfid_read'):
+                    rfid_tag, _ = station.rfid_reader.read_rfid()
+                if not rfid_tag:
+                    break
+                self.audit.log("rfid_read", job_id=job.id, station=station.id, operation="issue_batch",
+                               rfid_tag=rfid_tag)
+                if rfid_tag not in tags:
+                    tags.append(rfid_tag)
+            if not tags:
+                job.update("error", "RFID read failed!")
+                self.audit.log("rfid_failed", job_id=job.id, station=station.id, operation="issue_batch")
+                return
+            
+            conn = self.get_connection()
+            try:
+                with registry.timer('db_lookup'):
+                    rows = conn.execute(queries.issue_batch_lookup(len(tags)), tags).fetchall()
+                books = {row[3]: row for row in rows}
+                available = [books[tag] for tag in tags if tag in books and books[tag][2] == 'available']
+                skipped = [tag for tag in tags if tag not in books or books[tag][2] != 'available']
+                if not available:
+                    job.update("error", "Books unavailable!")
+                    self.audit.log("issue_failed", job_id=job.id, rfid_tags=skipped, reason="book_unavailable")
+                    return
+                
+                user_id, user_name, capture, reason = self.identify_patron(job, station)
+                if reason:
+                    self.audit.log("issue_failed", job_id=job.id, book_ids=[b[0] for b in available], reason=reason)
+                    return
+                
+                job.update("processing", f"Issuing {len(available)} books to {user_name}...")
+                issue_date = datetime.now()
+                due_date = issue_date + timedelta(days=14)
+                issued = []
+                with registry.timer('db_commit'):
+                    with conn:
+                        for book_id, title, _, rfid_tag in available:
+                            # Guarded so a book issued at another desk since the lookup is skipped, not issued twice
+                            if conn.execute("UPDATE books SET status='issued' WHERE book_id=? AND status='available'",
+                                            (book_id,)).rowcount == 0:
+                                skipped.append(rfid_tag)
+                                continue
+                            cur = conn.execute('INSERT INTO transactions (book_id, user_id, rfid_tag, issue_date, due_date, status) VALUES (?, ?, ?, ?, ?, ?)',
+                                               (book_id, user_id, rfid_tag, issue_date.strftime('%Y-%m-%d %H:%M:%S'),
+                                                due_date.strftime('%Y-%m-%d %H:%M:%S'), 'issued'))
+                            issued.append((cur.lastrowid, book_id, title))
+            finally:
+                conn.close()
+            self.search_cache.invalidate()
+            if issued:
+                # One crop is the evidence for the whole batch
+                self.archiver.archive_capture(capture, transaction_ids=[t[0] for t in issued], kind='issue')
+            for transaction_id, book_id, _ in issued:
+                self.due_dates.schedule(transaction_id, due_date.strftime('%Y-%m-%d %H:%M:%S'))
+                self.audit.log("issued", transaction_id, job_id=job.id, book_id=book_id, user_id=user_id, batch=True)
+            
+            message = f"{len(issued)} books issued to {user_name}!"
+            if skipped:
+                message += f" Unavailable: {', '.join(skipped)}"
+            job.update("success" if issued else "error", message)
+        except Exception as e:
+            job.update("error", f"Error: {str(e)}")
+            print(f"Batch issue error: {e}")
+            self.audit.log("issue_failed", job_id=job.id, reason="exception", error=str(e))
     
-    def return_book(self):
-        global operation_status
+    def return_book(self, job, station):
         try:
-            operation_status = {"status": "reading_rfid", "message": "Reading RFID..."}
-            print("Return Book: Reading RFID...")
+            job.update("reading_rfid", "Reading RFID...")
             
-            rfid_tag, _ = self.rfid_reader.read_rfid()
+            with registry.timer('rfid_read'):
+                rfid_tag, _ = station.rfid_reader.read_rfid()
             if not rfid_tag:
-                operation_status = {"status": "error", "message": "RFID read failed!"}
+                job.update("error", "RFID read failed!")
+                self.audit.log("rfid_failed", job_id=job.id, station=station.id, operation="return")
                 return
+            self.audit.log("rfid_read", job_id=job.id, station=station.id, operation="return", rfid_tag=rfid_tag)
             
             conn = self.get_connection()
             cur = conn.cursor()
-            cur.execute('''SELECT t.transaction_id, t.book_id, b.title, u.name, u.face_encoding 
-                          FROM transactions t 
-                          JOIN books b ON t.book_id=b.book_id
-                          JOIN users u ON t.user_id=u.user_id 
-                          WHERE t.rfid_tag=? AND t.status='issued' ''', (rfid_tag,))
-            trans = cur.fetchone()
+            with registry.timer('db_lookup'):
+                cur.execute(queries.RETURN_LOOKUP, (rfid_tag,))
+                trans = cur.fetchone()
             
             if not trans:
-                operation_status = {"status": "error", "message": "No active transaction!"}
+                job.update("error", "No active transaction!")
+                self.audit.log("return_failed", job_id=job.id, rfid_tag=rfid_tag, reason="no_active_transaction")
                 conn.close()
                 return
             
             tid, book_id, book_title, user_name, known_enc_bytes = trans
-            print(f"Book found: {book_title}, issued to: {user_name}")
             
-            operation_status = {"status": "verifying", "message": "Look at camera..."}
-            print("Verifying user...")
-            time.sleep(2)
+            job.update("verifying", "Look at camera...")
             
             # Capture and verify
-            frame_array = self.face_system.picam2.capture_array()
-            frame_rgb = cv2.cvtColor(frame_array, cv2.COLOR_BGR2RGB)
-            
-            face_locations = face_recognition.face_locations(frame_rgb)
-            print(f"Found {len(face_locations)} faces")
-            
-            if len(face_locations) == 0:
-                operation_status = {"status": "error", "message": "No face detected!"}
-                print("No face detected!")
-                time.sleep(3)
+            with registry.timer('capture_burst'):
+                captures, reason = station.face_system.capture_burst(self.burst_size)
+            if reason:
+                job.update("error", station.face_system.capture_messages[reason])
+                self.audit.log("return_failed", tid, job_id=job.id, reason=reason)
                 conn.close()
                 return
             
-            face_encodings = face_recognition.face_encodings(frame_rgb, face_locations)
+            with registry.timer('encode_burst'):
+                face_encodings = station.face_system.encode_burst(captures)
             
-            if not face_encodings:
-                operation_status = {"status": "error", "message": "Failed to encode face!"}
-                print("Failed to encode face!")
-                time.sleep(3)
+            if len(face_encodings) == 0:
+                job.update("error", "Failed to encode face!")
+                self.audit.log("return_failed", tid, job_id=job.id, reason="encode_failed")
                 conn.close()
                 return
             
-            current_encoding = face_encodings[0]
-            known_encoding = pickle.loads(known_enc_bytes)
-            
-            matches = face_recognition.compare_faces([known_encoding], current_encoding, tolerance=0.6)
-            distance = face_recognition.face_distance([known_encoding], current_encoding)
-            print(f"Face match: {matches[0]}, distance: {distance[0]}")
+            with registry.timer('face_verify'):
+                known_encoding = decode_encoding(known_enc_bytes)
+                distance = station.face_system.fused_distance(known_encoding, face_encodings)
+            matched = distance <= self.match_tolerance
+            self.audit.log("face_match", tid, job_id=job.id, distance=round(float(distance), 4), matched=matched,
+                           frames=len(face_encodings))
             
-            if not matches[0]:
-                operation_status = {"status": "error", "message": "Invalid user! Face mismatch!"}
-                print("Face mismatch!")
-                time.sleep(3)
+            if not matched:
+                job.update("error", "Invalid user! Face mismatch!")
+                self.audit.log("return_failed", tid, job_id=job.id, reason="face_mismatch")
                 conn.close()
                 return
             
-            print(f"User verified: {user_name}")
-            operation_status = {"status": "processing", "message": f"Processing return..."}
+            job.update("processing", f"Processing return...")
             
             return_date = datetime.now()
-            cur.execute('UPDATE transactions SET return_date=?, status=? WHERE transaction_id=?',
-                       (return_date.strftime('%Y-%m-%d %H:%M:%S'), 'returned', tid))
-            cur.execute('UPDATE books SET status=? WHERE book_id=?', ('available', book_id))
-            conn.commit()
+            with registry.timer('db_commit'):
+                cur.execute('UPDATE transactions SET return_date=?, status=? WHERE transaction_id=?',
+                           (return_date.strftime('%Y-%m-%d %H:%M:%S'), 'returned', tid))
+                cur.execute('UPDATE books SET status=? WHERE book_id=?', ('available', book_id))
+                conn.commit()
             conn.close()
+            self.archiver.archive_capture(captures[-1], transaction_ids=[tid], kind='return')
+            self.search_cache.invalidate()
+            self.audit.log("returned", tid, job_id=job.id, book_id=book_id)
             
-            operation_status = {"status": "success", "message": f"Book '{book_title}' returned by {user_name}!"}
-            print(f"Book returned successfully by {user_name}")
-            time.sleep(3)
+            job.update("success", f"Book '{book_title}' returned by {user_name}!")
         except Exception as e:
-            operation_status = {"status": "error", "message": f"Error: {str(e)}"}
+            job.update("error", f"Error: {str(e)}")
             print(f"Return error: {e}")
-            time.sleep(3)
+            self.audit.log("return_failed", job_id=job.id, reason="exception", error=str(e))
     
     def delete_book(self, book_id):
         conn = self.get_connection()
@@ -307,18 +561,23 @@ class LibraryManagementSystem:
         cur.execute('DELETE FROM books WHERE book_id=?', (book_id,))
         conn.commit()
         conn.close()
+        self.search_cache.invalidate()
         return {"status": "success", "message": "Book deleted!"}
     
     def delete_user(self, user_id):
         conn = self.get_connection()
         cur = conn.cursor()
-        cur.execute('SELECT COUNT(*) FROM transactions WHERE user_id=? AND status="issued"', (user_id,))
+        cur.execute(queries.USER_ACTIVE_COUNT, (user_id,))
         if cur.fetchone()[0] > 0:
             conn.close()
             return {"status": "error", "message": "User has active issues!"}
         cur.execute('UPDATE users SET is_active=0 WHERE user_id=?', (user_id,))
         conn.commit()
         conn.close()
+        self.components.wait_ready('gallery')
+        self.gallery.remove(user_id)
+        self.sessions.end_user(user_id)
+        self.gallery.save_ann()
         return {"status": "success", "message": "User deleted!"}
     
     def clear_database(self):
@@ -330,96 +589,314 @@ class LibraryManagementSystem:
         cur.execute('DELETE FROM users')
         conn.commit()
         conn.close()
+        self.components.wait_ready('gallery')
+        self.gallery.clear()
+        self.sessions.clear()
+        self.search_cache.invalidate()
+        self.gallery.save_ann()
         return {"status": "success", "message": "All data cleared!"}
     
-    def get_all_books(self):
+    def _iter_rows(self, sql, params):
+        """Yield rows straight from the cursor, closing the connection when the consumer stops.
+        Streamed responses last as long as the client reads, so they never hold a pooled connection"""
+        conn = self.db_pool.dedicated()
+        try:
+            for row in conn.execute(sql, params):
+                yield row
+        finally:
+            conn.close()
+    
+    def list_books(self, filters, sort='id', descending=False, cursor=None, limit=100):
+        columns, tables, id_column, where = queries.BOOK_LISTING
+        where, params = list(where), []
+        for field in ('status', 'category', 'author'):
+            if filters.get(field):
+                where.append(f'b.{field}=?')
+                params.append(filters[field])
+        sql, params = build_keyset_query(columns, tables, where, params, BOOK_SORTS[sort], id_column,
+                                         descending, cursor, limit)
+        return self._iter_rows(sql, params)
+    
+    def list_users(self, filters, sort='id', descending=False, cursor=None, limit=100):
+        columns, tables, id_column, where = queries.USER_LISTING
+        where, params = list(where), []
+        if filters.get('name'):
+            where.append("u.name LIKE ? ESCAPE '\\'")
+            name = filters['name'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(name + '%')
+        sql, params = build_keyset_query(columns, tables, where, params, USER_SORTS[sort], id_column,
+                                         descending, cursor, limit)
+        return self._iter_rows(sql, params)
+    
+    def list_transactions(self, filters, sort='id', descending=True, cursor=None, limit=100):
+        columns, tables, id_column, where = queries.TRANSACTION_LISTING
+        where, params = list(where), []
+        if filters.get('status'):
+            where.append('t.status=?')
+            params.append(filters['status'])
+        for field in ('user_id', 'book_id'):
+            if filters.get(field):
+                where.append(f't.{field}=?')
+                params.append(int(filters[field]))
+        # Dates are stored as 'YYYY-MM-DD HH:MM:SS' strings, so range filters compare lexically
+        for arg, clause in (('issued_from', 't.issue_date >= ?'), ('issued_to', 't.issue_date < ?'),
+                            ('due_from', 't.due_date >= ?'), ('due_to', 't.due_date < ?')):
+            if filters.get(arg):
+                where.append(clause)
+                params.append(parse_date_arg(filters[arg]))
+        sql, params = build_keyset_query(columns, tables, where, params, TRANSACTION_SORTS[sort], id_column,
+                                         descending, cursor, limit)
+        return self._iter_rows(sql, params)
+    
+    def search_books(self, query, limit=20, prefix=True):
+        """Ranked full-text search over title, author, ISBN and category"""
+        terms = re.findall(r'\w+', query.lower())
+        if not terms:
+            return []
+        key = (tuple(terms), limit, prefix)
+        cached = self.search_cache.get(key)
+        if cached is not None:
+            return cached
+        generation = self.search_cache.generation()
+    
+        # Quote every term so user input can never be parsed as FTS5 syntax; prefix-match the last one
+        match = ' '.join(f'"{t}"' for t in terms[:-1])
+        match += f' "{terms[-1]}"' + ('*' if prefix else '')
         conn = self.get_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT book_id, title, author, category, status FROM books')
-        books = cur.fetchall()
-        conn.close()
-        return books
+        try:
+            rows = conn.execute('''SELECT b.book_id, b.title, b.author, b.category, b.status,
+                                          bm25(books_fts, 10.0, 5.0, 2.0, 1.0) AS score
+                                   FROM books_fts JOIN books b ON b.book_id = books_fts.rowid
+                                   WHERE books_fts MATCH ?
+                                   ORDER BY score LIMIT ?''', (match.strip(), limit)).fetchall()
+        finally:
+            conn.close()
+        self.search_cache.put(key, rows, generation)
+        return rows
     
-    def get_all_users(self):
+    def get_stats(self, popular=10):
+        """Dashboard summary read from the trigger-maintained statistics tables"""
         conn = self.get_connection()
-        cur = conn.cursor()
-        cur.execute('SELECT user_id, name, email, phone FROM users WHERE is_active=1')
-        users = cur.fetchall()
-        conn.close()
-        return users
+        try:
+            counters = dict(conn.execute('SELECT key, value FROM circulation_stats'))
+            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            # Overdue depends on the clock, so count it as an index range instead of materializing it
+            overdue = conn.execute("SELECT COUNT(*) FROM transactions WHERE status='issued' AND due_date < ?",
+                                   (now,)).fetchone()[0]
+            top = conn.execute('''SELECT c.book_id, b.title, b.author, c.issue_count
+                                  FROM book_loan_counts c JOIN books b ON b.book_id = c.book_id
+                                  ORDER BY c.issue_count DESC LIMIT ?''', (popular,)).fetchall()
+        finally:
+            conn.close()
+        return counters, overdue, top
     
-    def get_all_transactions(self):
+    def get_user_active_loans(self, user_id):
         conn = self.get_connection()
-        cur = conn.cursor()
-        cur.execute('''SELECT t.transaction_id, b.title, u.name, t.issue_date, t.due_date, t.return_date, t.status
-                      FROM transactions t JOIN books b ON t.book_id=b.book_id JOIN users u ON t.user_id=u.user_id
-                      ORDER BY t.transaction_id DESC''')
-        trans = cur.fetchall()
-        conn.close()
-        return trans
+        try:
+            row = conn.execute('SELECT active_loans FROM user_active_loans WHERE user_id=?', (user_id,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0
+    
+    def import_records(self, table, stream, fmt):
+        """Bulk-load books or users from a CSV/JSONL text stream"""
+        conn = self.get_connection()
+        try:
+            report = bulk_io.import_records(conn, table, bulk_io.read_records(stream, fmt))
+            if table == 'books' and report["inserted"]:
+                self.search_cache.invalidate()
+            if table == 'users' and report["inserted"]:
+                self.components.wait_ready('gallery')
+                self.gallery.load(conn)
+                self.gallery.save_ann()
+        finally:
+            conn.close()
+        return report
+    
+    def export_records(self, kind, fmt):
+        return self._iter_chunks(kind, fmt)
+    
+    def _iter_chunks(self, kind, fmt):
+        conn = self.db_pool.dedicated()
+        try:
+            yield from bulk_io.export_records(conn, kind, fmt)
+        finally:
+            conn.close()
     
     def get_active_transactions(self):
         conn = self.get_connection()
         cur = conn.cursor()
-        cur.execute('''SELECT t.transaction_id, b.title, u.name, t.issue_date, t.due_date
-                      FROM transactions t JOIN books b ON t.book_id=b.book_id JOIN users u ON t.user_id=u.user_id
-                      WHERE t.status='issued' ''')
+        # overdue is flagged by the due-date scheduler, so no dates are compared per request
+        cur.execute(queries.ACTIVE_TRANSACTIONS)
         trans = cur.fetchall()
         conn.close()
         return trans
 
+def parse_date_arg(value):
+    """Normalize a YYYY-MM-DD[ HH:MM:SS] query parameter; raises ValueError"""
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(value, fmt).strftime('%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            pass
+    raise ValueError(f"Invalid date: {value}")
+
 def init_lms():
+    """Return the shared system; creating it only opens the database, devices come up in the background"""
     global lms_instance
-    if not lms_instance:
-        lms_instance = LibraryManagementSystem()
+    with lms_lock:
+        if not lms_instance:
+            lms_instance = LibraryManagementSystem()
+            for station in lms_instance.stations.values():
+                station.scheduler.listeners.append(status_events.publish)
+                # Every station has a state for clients that connect before its first job
+                status_events.publish(station.scheduler.latest)
+            lms_instance.start()
     return lms_instance
 
-def generate_frames():
-    lms = init_lms()
-    while True:
-        try:
-            frame = lms.face_system.picam2.capture_array()
-            frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-            _, buffer = cv2.imencode('.jpg', frame_bgr)
-            yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-        except:
-            time.sleep(0.1)
+def not_ready_response(states):
+    return jsonify({"status": "starting", "message": "Hardware is still starting, try again shortly",
+                    "components": states}), 503, {'Retry-After': '2'}
+
+def station_or_404(station_id):
+    station = init_lms().get_station(station_id)
+    if station is None:
+        abort(404, description=f"Unknown station: {station_id}")
+    return station
+
+def generate_frames(station):
+    subscriber = station.broadcaster.subscribe()
+    yield from subscriber.frames()
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/video_feed')
-def video_feed():
-    return Response(generate_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+@app.route('/video_feed', defaults={'station_id': None})
+@app.route('/stations/<station_id>/video_feed')
+def video_feed(station_id):
+    station = station_or_404(station_id)
+    if not station.components.is_ready('camera'):
+        return not_ready_response({"camera": station.components.state['camera']})
+    return Response(generate_frames(station), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/health')
+def health():
+    lms = init_lms()
+    conn = lms.get_connection()
+    try:
+        conn.execute('SELECT 1').fetchone()
+    except sqlite3.Error as e:
+        return jsonify({"status": "error", "message": str(e)}), 503
+    finally:
+        conn.close()
+    return jsonify({"status": "ok"})
+
+@app.route('/ready')
+def ready():
+    lms = init_lms()
+    is_ready = lms.is_ready()
+    return jsonify({"ready": is_ready, "components": {"database": {"state": "ready"}, **lms.components.state},
+                    "stations": {sid: station.components.state for sid, station in lms.stations.items()}}), \
+        200 if is_ready else 503
+
+@app.route('/stations')
+def get_stations():
+    return jsonify([station.to_dict() for station in init_lms().stations.values()])
+
+@app.route('/db/stats')
+def db_stats():
+    lms = init_lms()
+    return jsonify({**lms.db_pool.stats(),
+                    "audit": {"queued": lms.audit.queue_depth, "written": lms.audit.written,
+                              "dropped": lms.audit.dropped},
+                    "captures": {"queued": lms.archiver.queue_depth, "written": lms.archiver.written,
+                                 "dropped": lms.archiver.dropped, "evicted": lms.archiver.evicted,
+                                 "bytes": lms.archiver.disk_bytes}})
+
+@app.route('/status', defaults={'station_id': None})
+@app.route('/stations/<station_id>/status')
+def status(station_id):
+    return jsonify(station_or_404(station_id).scheduler.latest)
+
+@app.route('/status/stream')
+def status_stream():
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    last_id = int(last_id) if last_id and last_id.isdigit() else None
+    return Response(status_events.stream(last_id), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def submit_job(station, kind, fn, args=(), resources=()):
+    """Queue fn(job, station, *args) on the station's own lane once the components it needs are up"""
+    lms = init_lms()
+    # Station devices per locked resource; camera jobs also need the shared models and gallery
+    waiting = {name: state for name, state in station.components.state.items()
+               if name in resources and state["state"] != "ready"}
+    if 'camera' in resources:
+        waiting.update({name: state for name, state in lms.components.state.items() if state["state"] != "ready"})
+    if waiting:
+        return not_ready_response(waiting)
+    # ?profile=1 runs this one job under the sampling profiler; fetch the stacks from /jobs/<id>/profile
+    profile = request.args.get('profile') == '1'
+    try:
+        job = station.scheduler.submit(kind, fn, (station,) + tuple(args), resources, profile=profile)
+    except QueueFull as e:
+        return jsonify({"status": "busy", "message": f"Too many pending operations ({e})"}), 429
+    return jsonify({"status": "started", "job_id": job.id, "station": station.id})
+
+@app.route('/jobs/<int:job_id>')
+def get_job(job_id):
+    job = init_lms().get_job(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify(job.to_dict())
 
-@app.route('/status')
-def status():
-    return jsonify(operation_status)
+@app.route('/jobs/<int:job_id>/profile')
+def get_job_profile(job_id):
+    job = init_lms().get_job(job_id)
+    if job is None or job.profile_output is None:
+        return jsonify({"status": "error", "message": "No profile for this job"}), 404
+    return Response(job.profile_output, mimetype='text/plain')
 
-@app.route('/register_book', methods=['POST'])
-def register_book():
+@app.route('/metrics')
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/register_book', methods=['POST'], defaults={'station_id': None})
+@app.route('/stations/<station_id>/register_book', methods=['POST'])
+def register_book(station_id):
+    station = station_or_404(station_id)
     data = request.json
-    threading.Thread(target=init_lms().register_book,
-                    args=(data['title'], data['author'], data['isbn'], data['category'])).start()
-    return jsonify({"status": "started"})
+    return submit_job(station, 'register_book', init_lms().register_book,
+                      (data['title'], data['author'], data['isbn'], data['category']), resources=('rfid',))
 
-@app.route('/register_user', methods=['POST'])
-def register_user():
+@app.route('/register_user', methods=['POST'], defaults={'station_id': None})
+@app.route('/stations/<station_id>/register_user', methods=['POST'])
+def register_user(station_id):
+    station = station_or_404(station_id)
     data = request.json
-    threading.Thread(target=init_lms().register_user,
-                    args=(data['name'], data['email'], data['phone'])).start()
-    return jsonify({"status": "started"})
+    return submit_job(station, 'register_user', init_lms().register_user,
+                      (data['name'], data['email'], data['phone']), resources=('camera',))
+
+@app.route('/issue_book', methods=['POST'], defaults={'station_id': None})
+@app.route('/stations/<station_id>/issue_book', methods=['POST'])
+def issue_book(station_id):
+    return submit_job(station_or_404(station_id), 'issue_book', init_lms().issue_book, resources=('rfid', 'camera'))
 
-@app.route('/issue_book', methods=['POST'])
-def issue_book():
-    threading.Thread(target=init_lms().issue_book).start()
-    return jsonify({"status": "started"})
+@app.route('/return_book', methods=['POST'], defaults={'station_id': None})
+@app.route('/stations/<station_id>/return_book', methods=['POST'])
+def return_book(station_id):
+    return submit_job(station_or_404(station_id), 'return_book', init_lms().return_book, resources=('rfid', 'camera'))
 
-@app.route('/return_book', methods=['POST'])
-def return_book():
-    threading.Thread(target=init_lms().return_book).start()
-    return jsonify({"status": "started"})
+@app.route('/issue_books', methods=['POST'], defaults={'station_id': None})
+@app.route('/stations/<station_id>/issue_books', methods=['POST'])
+def issue_books(station_id):
+    station = station_or_404(station_id)
+    data = request.get_json(silent=True) or {}
+    count = data.get('count', 10)
+    if not isinstance(count, int) or not 1 <= count <= 50:
+        return jsonify({"status": "error", "message": "count must be an integer from 1 to 50"}), 400
+    return submit_job(station, 'issue_books', init_lms().issue_books, (count,), resources=('rfid', 'camera'))
 
 @app.route('/delete_book/<int:book_id>', methods=['DELETE'])
 def delete_book(book_id):
@@ -433,26 +910,100 @@ def delete_user(user_id):
 def clear_database():
     return jsonify(init_lms().clear_database())
 
+def listing_response(list_fn, sorts, to_item, default_descending=False):
+    args = request.args
+    try:
+        sort, descending, cursor, limit = parse_listing_args(args, sorts)
+        if 'order' not in args:
+            descending = default_descending
+        for arg in ('issued_from', 'issued_to', 'due_from', 'due_to'):
+            if args.get(arg):
+                parse_date_arg(args[arg])
+        for arg in ('user_id', 'book_id'):
+            if args.get(arg) and not args[arg].isdigit():
+                raise ValueError(f"{arg} must be an integer")
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    rows = list_fn(args, sort, descending, cursor, limit)
+    return Response(stream_page(rows, to_item, limit), mimetype='application/json')
+
 @app.route('/books')
 def get_books():
-    return jsonify([{"id": b[0], "title": b[1], "author": b[2], "category": b[3], "status": b[4]}
-                   for b in init_lms().get_all_books()])
+    return listing_response(init_lms().list_books, BOOK_SORTS,
+                            lambda b: {"id": b[0], "title": b[1], "author": b[2], "category": b[3], "status": b[4]})
+
+@app.route('/books/search')
+def search_books():
+    query = request.args.get('q', '')
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), 100))
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit must be an integer"}), 400
+    prefix = request.args.get('prefix', '1') != '0'
+    rows = init_lms().search_books(query, limit=limit, prefix=prefix)
+    return jsonify({"items": [{"id": b[0], "title": b[1], "author": b[2], "category": b[3], "status": b[4],
+                               "score": round(-b[5], 4)} for b in rows],
+                    "count": len(rows)})
+
+@app.route('/stats')
+def get_stats():
+    counters, overdue, top = init_lms().get_stats()
+    return jsonify({
+        "books": {"total": counters.get('books_total', 0), "available": counters.get('books_available', 0),
+                  "issued": counters.get('books_issued', 0)},
+        "users_active": counters.get('users_active', 0),
+        "transactions": {"total": counters.get('transactions_total', 0), "active": counters.get('loans_issued', 0),
+                         "returned": counters.get('loans_returned', 0), "overdue": overdue},
+        "popular": [{"id": b[0], "title": b[1], "author": b[2], "issues": b[3]} for b in top],
+    })
+
+@app.route('/stats/users/<int:user_id>')
+def get_user_stats(user_id):
+    return jsonify({"user_id": user_id, "active_loans": init_lms().get_user_active_loans(user_id)})
 
 @app.route('/users')
 def get_users():
-    return jsonify([{"id": u[0], "name": u[1], "email": u[2], "phone": u[3]}
-                   for u in init_lms().get_all_users()])
+    return listing_response(init_lms().list_users, USER_SORTS,
+                            lambda u: {"id": u[0], "name": u[1], "email": u[2], "phone": u[3]})
 
 @app.route('/transactions')
 def get_transactions():
-    return jsonify([{"id": t[0], "book": t[1], "user": t[2], "issue_date": t[3],
-                    "due_date": t[4], "return_date": t[5] or "N/A", "status": t[6]}
-                   for t in init_lms().get_all_transactions()])
+    return listing_response(init_lms().list_transactions, TRANSACTION_SORTS,
+                            lambda t: {"id": t[0], "book": t[1], "user": t[2], "issue_date": t[3],
+                                       "due_date": t[4], "return_date": t[5] or "N/A", "status": t[6]},
+                            default_descending=True)
+
+@app.route('/import/<table>', methods=['POST'])
+def import_records(table):
+    if table not in bulk_io.IMPORTERS:
+        return jsonify({"status": "error", "message": f"Cannot import into {table}"}), 404
+    fmt = request.args.get('format') or ('jsonl' if 'json' in (request.mimetype or '') else 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({"status": "error", "message": "format must be csv or jsonl"}), 400
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    report = init_lms().import_records(table, stream, fmt)
+    report["status"] = "success" if not report["failed"] else "partial"
+    return jsonify(report)
+
+@app.route('/export/<kind>')
+def export_records(kind):
+    if kind not in bulk_io.EXPORTERS:
+        return jsonify({"status": "error", "message": f"Cannot export {kind}"}), 404
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({"status": "error", "message": "format must be csv or jsonl"}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(init_lms().export_records(kind, fmt), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'})
 
 @app.route('/transactions/active')
 def get_active_transactions():
-    return jsonify([{"id": t[0], "book": t[1], "user": t[2], "issue_date": t[3], "due_date": t[4]}
+    return jsonify([{"id": t[0], "book": t[1], "user": t[2], "issue_date": t[3], "due_date": t[4],
+                     "overdue": bool(t[5])}
                    for t in init_lms().get_active_transactions()])
 
 if __name__ == '__main__':
+    # Start warming up at boot; under the debug reloader only the serving child process owns the devices
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        init_lms()
     app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
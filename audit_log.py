@@ -0,0 +1,99 @@
+# audit_log.py
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+def compact_logs(conn, retention_days=90):
+    """Fold log rows older than the retention window into one 'summary' row per day and action"""
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime('%Y-%m-%d %H:%M:%S')
+    with conn:
+        conn.execute('''INSERT INTO activity_logs (action, timestamp, remarks)
+                        SELECT 'summary', date(timestamp), json_object('action', action, 'count', COUNT(*))
+                        FROM activity_logs WHERE timestamp < ? AND action != 'summary'
+                        GROUP BY date(timestamp), action''', (cutoff,))
+        removed = conn.execute("DELETE FROM activity_logs WHERE timestamp < ? AND action != 'summary'",
+                               (cutoff,)).rowcount
+    return removed
+
+class AuditWriter:
+    def __init__(self, get_connection, batch_size=200, flush_interval=1.0, max_queue=10000,
+                 retention_days=90, compact_interval=24 * 3600):
+        """Queue audit events from the hot path and write them to activity_logs in batches on a background thread"""
+        self.get_connection = get_connection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.compact_interval = compact_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        # monotonic() counts from boot, so 0.0 would hold compaction back for a day of uptime
+        self._last_compaction = float('-inf')
+        self.written = 0
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def log(self, action, transaction_id=None, **details):
+        """Enqueue an event without blocking; events are dropped (and counted) if the writer falls far behind"""
+        event = (transaction_id, action, datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                 json.dumps(details, default=str) if details else None)
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been written"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print(f"Audit write error ({len(batch)} events lost): {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            self._maybe_compact()
+
+    def _write(self, batch):
+        conn = self.get_connection()
+        try:
+            with conn:
+                conn.executemany('INSERT INTO activity_logs (transaction_id, action, timestamp, remarks) VALUES (?, ?, ?, ?)',
+                                 batch)
+            self.written += len(batch)
+        finally:
+            conn.close()
+
+    def _maybe_compact(self):
+        if not self.retention_days or time.monotonic() - self._last_compaction < self.compact_interval:
+            return
+        self._last_compaction = time.monotonic()
+        conn = self.get_connection()
+        try:
+            removed = compact_logs(conn, self.retention_days)
+            if removed:
+                print(f"Compacted {removed} audit log rows older than {self.retention_days} days")
+        except Exception as e:
+            print(f"Audit compaction error: {e}")
+        finally:
+            conn.close()
@@ -0,0 +1,165 @@
+# benchmark.py
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+from drivers import ReplayCamera, ScriptedRFIDReader
+from encoding_format import encode_encoding
+from metrics import registry
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+def seed_gallery(db_name, size, seed=0):
+    """Insert size synthetic users whose encodings are far from any real face"""
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.executemany('INSERT INTO users (name, email, face_encoding) VALUES (?, ?, ?)',
+                         ((f'Synthetic {i}', f'synthetic{i}@bench.local', encode_encoding(rng.normal(0, 0.1, 128)))
+                          for i in range(size)))
+    conn.close()
+
+def run_benchmark(fixtures, iterations=10, concurrency=2, gallery_size=1000, use_ann_index=False, fps=30,
+                  workdir=None, stations=1):
+    """Drive register, issue and return end to end against replay drivers; returns the result summary.
+    Clients are spread round-robin over the stations, each with its own replay camera and RFID script"""
+    from database_setup import create_database
+    from app import LibraryManagementSystem
+
+    workdir = workdir or tempfile.mkdtemp(prefix='lms-bench-')
+    db_name = os.path.join(workdir, 'benchmark.db')
+    create_database(db_name=db_name)
+    seed_gallery(db_name, gallery_size)
+
+    devices = {f'desk{i + 1}': {"camera": ReplayCamera(fixtures, fps=fps),
+                                "rfid_reader": ScriptedRFIDReader(timeout=5.0)} for i in range(stations)}
+    lms = LibraryManagementSystem(use_ann_index=use_ann_index, db_name=db_name, stations=devices)
+    lms.start()
+    if not lms.wait_ready(timeout=120):
+        raise RuntimeError(f"System failed to start: {lms.components.state}")
+    operations = []
+    operations_lock = threading.Lock()
+
+    def run(station, kind, fn, tag=None, args=(), resources=('rfid', 'camera')):
+        def present_and_run(job, station, *args):
+            # The tag is placed on the reader only once this job holds the devices, like a patron at the kiosk
+            if tag is not None:
+                station.rfid_reader.present(tag)
+            fn(job, station, *args)
+        start = time.perf_counter()
+        job = station.scheduler.submit(kind, present_and_run, (station,) + args, resources)
+        job.done.wait()
+        with operations_lock:
+            operations.append((kind, time.perf_counter() - start, job.status == 'success'))
+        return job
+
+    def client(index):
+        station = list(lms.stations.values())[index % stations]
+        tag = f'BENCH{index:04d}'
+        run(station, 'register_book', lms.register_book, tag, (f'Benchmark {index}', 'Bench', None, None), ('rfid',))
+        for _ in range(iterations):
+            run(station, 'issue_book', lms.issue_book, tag)
+            run(station, 'return_book', lms.return_book, tag)
+
+    registry.start_sampling()
+    started = time.perf_counter()
+    run(lms.default_station, 'register_user', lms.register_user, args=('Benchmark Patron', 'patron@bench.local', None),
+        resources=('camera',))
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    samples = registry.stop_sampling()
+    lms.audit.flush()
+
+    stages = {}
+    for name, labels, value in samples:
+        if name == 'lms_stage_seconds':
+            stages.setdefault(dict(labels)['stage'], []).append(value)
+    by_kind = {}
+    for kind, seconds, ok in operations:
+        by_kind.setdefault(kind, []).append((seconds, ok))
+
+    return {
+        "config": {"iterations": iterations, "concurrency": concurrency, "gallery_size": gallery_size,
+                   "ann": use_ann_index, "fps": fps, "stations": stations},
+        "elapsed_s": round(elapsed, 3),
+        "operations": {kind: {"count": len(runs), "failed": sum(not ok for _, ok in runs),
+                              "throughput_per_s": round(len(runs) / elapsed, 3),
+                              "p50_ms": round(percentile([s for s, _ in runs], 50) * 1000, 3),
+                              "p99_ms": round(percentile([s for s, _ in runs], 99) * 1000, 3)}
+                       for kind, runs in sorted(by_kind.items())},
+        "stages": {stage: {"count": len(values),
+                           "p50_ms": round(percentile(values, 50) * 1000, 3),
+                           "p99_ms": round(percentile(values, 99) * 1000, 3)}
+                   for stage, values in sorted(stages.items())},
+    }
+
+def print_report(result):
+    config = result["config"]
+    print(f"{config['concurrency']} clients on {config.get('stations', 1)} stations x {config['iterations']} issue/return cycles, "
+          f"gallery {config['gallery_size']}{' (ANN)' if config['ann'] else ''}, {result['elapsed_s']}s")
+    print(f"{'operation':<16}{'count':>7}{'failed':>8}{'ops/s':>9}{'p50 ms':>10}{'p99 ms':>10}")
+    for kind, op in result["operations"].items():
+        print(f"{kind:<16}{op['count']:>7}{op['failed']:>8}{op['throughput_per_s']:>9.2f}"
+              f"{op['p50_ms']:>10.1f}{op['p99_ms']:>10.1f}")
+    print(f"{'stage':<16}{'count':>7}{'':>8}{'':>9}{'p50 ms':>10}{'p99 ms':>10}")
+    for stage, st in result["stages"].items():
+        print(f"{stage:<16}{st['count']:>7}{'':>8}{'':>9}{st['p50_ms']:>10.2f}{st['p99_ms']:>10.2f}")
+
+def compare(result, baseline, tolerance=0.25, floor_ms=1.0):
+    """List latencies that grew by more than tolerance over the baseline; sub-floor_ms timings are ignored"""
+    regressions = []
+    for section in ("operations", "stages"):
+        for name, old in baseline.get(section, {}).items():
+            new = result[section].get(name)
+            if new is None:
+                continue
+            for key in ("p50_ms", "p99_ms"):
+                if old[key] >= floor_ms and new[key] > old[key] * (1 + tolerance):
+                    regressions.append(f"{section}.{name}.{key}: {old[key]:.1f} -> {new[key]:.1f}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark on replayed camera and RFID input")
+    parser.add_argument('fixtures', help="directory of face images or a video file showing one face")
+    parser.add_argument('--iterations', type=int, default=10, help="issue/return cycles per client")
+    parser.add_argument('--concurrency', type=int, default=2, help="clients submitting jobs at once")
+    parser.add_argument('--stations', type=int, default=1, help="checkout desks, each with its own drivers")
+    parser.add_argument('--gallery', type=int, default=1000, help="synthetic users in the face gallery")
+    parser.add_argument('--ann', action='store_true', help="use the approximate gallery index")
+    parser.add_argument('--fps', type=float, default=30, help="replay camera frame rate")
+    parser.add_argument('--save', help="write the results as JSON")
+    parser.add_argument('--baseline', help="fail if latencies regress against this saved result")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="allowed relative slowdown")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='lms-bench-')
+    try:
+        result = run_benchmark(args.fixtures, args.iterations, args.concurrency, args.gallery, args.ann, args.fps,
+                               workdir=workdir, stations=args.stations)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print_report(result)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(result, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
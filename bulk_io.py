@@ -0,0 +1,267 @@
+# bulk_io.py
+import base64
+import csv
+import io
+import json
+import sqlite3
+import sys
+import time
+from encoding_format import encode_encoding, decode_encoding
+
+MAX_REPORTED_ERRORS = 1000
+
+def _text(value):
+    return value.strip() if isinstance(value, str) else value
+
+def validate_book(record):
+    rfid_tag = _text(record.get('rfid_tag'))
+    title = _text(record.get('title'))
+    if not rfid_tag:
+        raise ValueError("rfid_tag is required")
+    if not title:
+        raise ValueError("title is required")
+    # An issued book needs its transaction to be returned or deleted, so loans are only made at a station
+    status = _text(record.get('status')) or 'available'
+    if status != 'available':
+        raise ValueError(f"invalid status '{status}', only available books can be imported")
+    return (rfid_tag, title, _text(record.get('author')) or None, _text(record.get('isbn')) or None,
+            _text(record.get('category')) or None, status)
+
+def validate_user(record):
+    name = _text(record.get('name'))
+    if not name:
+        raise ValueError("name is required")
+    email = _text(record.get('email')) or None
+    if email and '@' not in email:
+        raise ValueError(f"invalid email '{email}'")
+    raw = record.get('face_encoding')
+    # Either base64 of the binary encoding format or a JSON list of 128 floats
+    if isinstance(raw, list):
+        vector = raw
+    elif isinstance(raw, str) and raw.lstrip().startswith('['):
+        vector = json.loads(raw)
+    elif isinstance(raw, str) and raw:
+        blob = base64.b64decode(raw, validate=True)
+        # Decoded in full so a truncated or wrong-sized blob is rejected here instead of breaking the gallery load
+        try:
+            dim = len(decode_encoding(blob))
+        except ValueError:
+            raise ValueError("face_encoding is not a valid binary encoding") from None
+        if dim != 128:
+            raise ValueError("face_encoding must have 128 values")
+        vector = None
+    else:
+        raise ValueError("face_encoding is required")
+    if vector is not None:
+        if len(vector) != 128:
+            raise ValueError("face_encoding must have 128 values")
+        blob = encode_encoding([float(v) for v in vector])
+    return (name, email, _text(record.get('phone')) or None, blob)
+
+# table -> (insert statement, row validator)
+IMPORTERS = {
+    'books': ('INSERT INTO books (rfid_tag, title, author, isbn, category, status) VALUES (?, ?, ?, ?, ?, ?)',
+              validate_book),
+    'users': ('INSERT INTO users (name, email, phone, face_encoding) VALUES (?, ?, ?, ?)', validate_user),
+}
+
+# kind -> (query, columns); streamed in rowid order so memory stays flat
+EXPORTERS = {
+    'transactions': ('''SELECT transaction_id, book_id, user_id, rfid_tag, issue_date, due_date, return_date, status,
+                               issue_face_path, return_face_path
+                        FROM transactions ORDER BY transaction_id''',
+                     ['transaction_id', 'book_id', 'user_id', 'rfid_tag', 'issue_date', 'due_date', 'return_date',
+                      'status', 'issue_face_path', 'return_face_path']),
+    'activity_logs': ('SELECT log_id, transaction_id, action, timestamp, remarks FROM activity_logs ORDER BY log_id',
+                      ['log_id', 'transaction_id', 'action', 'timestamp', 'remarks']),
+}
+
+def detect_format(name, default='csv'):
+    if name and name.lower().endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    if name and name.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+def read_records(stream, fmt):
+    """Yield (line_number, record) from a CSV or JSONL text stream without reading it all"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, e
+                continue
+            yield line_number, record if isinstance(record, dict) else ValueError("expected a JSON object")
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+def import_records(conn, table, records, batch_size=5000):
+    """Validate and insert records in batched executemany transactions; returns a per-row error report"""
+    if table not in IMPORTERS:
+        raise ValueError(f"Cannot import into {table}")
+    sql, validate = IMPORTERS[table]
+    report = {"table": table, "inserted": 0, "failed": 0, "errors": []}
+
+    def fail(line_number, error):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line_number, "error": str(error)})
+
+    def flush(batch):
+        if not batch:
+            return
+        try:
+            with conn:
+                conn.executemany(sql, [row for _, row in batch])
+            report["inserted"] += len(batch)
+        except sqlite3.IntegrityError:
+            # Replay the batch row by row so only the conflicting rows are rejected
+            with conn:
+                # Without an open transaction each RELEASE would commit its row on its own
+                conn.execute('BEGIN')
+                for line_number, row in batch:
+                    try:
+                        conn.execute('SAVEPOINT bulk_row')
+                        conn.execute(sql, row)
+                        conn.execute('RELEASE bulk_row')
+                        report["inserted"] += 1
+                    except sqlite3.IntegrityError as e:
+                        conn.execute('ROLLBACK TO bulk_row')
+                        conn.execute('RELEASE bulk_row')
+                        fail(line_number, e)
+
+    batch = []
+    for line_number, record in records:
+        if isinstance(record, Exception):
+            fail(line_number, record)
+            continue
+        try:
+            batch.append((line_number, validate(record)))
+        except (ValueError, TypeError) as e:
+            fail(line_number, e)
+            continue
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    flush(batch)
+    return report
+
+def export_records(conn, kind, fmt='jsonl', batch_size=2000):
+    """Yield CSV or JSONL text chunks for a table, fetching batch_size rows at a time"""
+    if kind not in EXPORTERS:
+        raise ValueError(f"Cannot export {kind}")
+    if fmt not in ('csv', 'jsonl'):
+        raise ValueError(f"Unsupported format: {fmt}")
+    sql, columns = EXPORTERS[kind]
+    cur = conn.cursor()
+    cur.execute(sql)
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            break
+        if fmt == 'csv':
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+
+def benchmark(rows=1000000, db_name='bulk_benchmark.db'):
+    """Time a full CSV import of rows books and a JSONL export of rows transactions"""
+    import os
+    import tempfile
+    from database_setup import create_tables, apply_migrations
+
+    if os.path.exists(db_name):
+        os.remove(db_name)
+    conn = sqlite3.connect(db_name)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    create_tables(conn)
+    apply_migrations(conn)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['rfid_tag', 'title', 'author', 'isbn', 'category'])
+        for i in range(rows):
+            writer.writerow([f'RFID{i:010d}', f'Title {i}', f'Author {i % 5000}', f'ISBN{i}', f'Cat{i % 50}'])
+        csv_path = f.name
+
+    start = time.perf_counter()
+    with open(csv_path, newline='') as f:
+        report = import_records(conn, 'books', read_records(f, 'csv'))
+    elapsed = time.perf_counter() - start
+    print(f"import books : {report['inserted']} rows in {elapsed:.1f}s ({report['inserted'] / elapsed:,.0f} rows/s)")
+    os.remove(csv_path)
+
+    conn.execute('''INSERT INTO transactions (book_id, user_id, rfid_tag, issue_date, due_date, status)
+                    SELECT book_id, 1, rfid_tag, '2024-01-01 10:00:00', '2024-01-15 10:00:00', 'returned' FROM books''')
+    conn.commit()
+
+    start = time.perf_counter()
+    written = 0
+    with open(os.devnull, 'w') as out:
+        for chunk in export_records(conn, 'transactions', 'jsonl'):
+            written += len(chunk)
+            out.write(chunk)
+    elapsed = time.perf_counter() - start
+    print(f"export trans : {rows} rows, {written / 1e6:.0f} MB in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+    conn.close()
+    os.remove(db_name)
+
+def main(argv):
+    usage = ("usage: python bulk_io.py import <books|users> <file.csv|file.jsonl>\n"
+             "       python bulk_io.py export <transactions|activity_logs> <file.csv|file.jsonl|->\n"
+             "       python bulk_io.py benchmark [rows]")
+    if len(argv) < 2:
+        print(usage)
+        return 2
+    command = argv[1]
+    if command == 'benchmark':
+        benchmark(int(argv[2]) if len(argv) > 2 else 1000000)
+        return 0
+    if len(argv) < 4:
+        print(usage)
+        return 2
+
+    conn = sqlite3.connect('library_management.db')
+    try:
+        if command == 'import':
+            with open(argv[3], newline='', encoding='utf-8') as f:
+                report = import_records(conn, argv[2], read_records(f, detect_format(argv[3])))
+            print(f"Imported {report['inserted']} rows into {argv[2]}, {report['failed']} failed")
+            for error in report['errors']:
+                print(f"  line {error['line']}: {error['error']}")
+            return 1 if report['failed'] else 0
+        if command == 'export':
+            fmt = detect_format(argv[3], default='jsonl')
+            out = sys.stdout if argv[3] == '-' else open(argv[3], 'w', newline='', encoding='utf-8')
+            try:
+                for chunk in export_records(conn, argv[2], fmt):
+                    out.write(chunk)
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            return 0
+        print(usage)
+        return 2
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
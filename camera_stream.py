@@ -0,0 +1,87 @@
+# camera_stream.py
+import threading
+import time
+
+class CameraStream:
+    def __init__(self, camera, buffer_size=8):
+        """Single producer thread that owns the camera and publishes frames into a ring buffer"""
+        self.camera = camera
+        self.buffer_size = buffer_size
+        self._slots = [None] * buffer_size
+        self._seq = -1
+        self._new_frame = threading.Condition()
+        self._running = False
+        self._thread = None
+        self.errors = 0
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="camera-stream", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self):
+        while self._running:
+            try:
+                frame = self.camera.capture_array()
+            except Exception as e:
+                self.errors += 1
+                print(f"Camera capture error: {e}")
+                time.sleep(0.1)
+                continue
+            seq = self._seq + 1
+            # Fill the slot before bumping the sequence so readers never see a half-written entry
+            self._slots[seq % self.buffer_size] = (seq, time.monotonic(), frame)
+            self._seq = seq
+            with self._new_frame:
+                self._new_frame.notify_all()
+
+    @property
+    def sequence(self):
+        return self._seq
+
+    @property
+    def fps(self):
+        """Capture rate over the frames still held in the ring buffer"""
+        entries = [entry for entry in self._slots if entry is not None]
+        if len(entries) < 2:
+            return 0.0
+        first = min(entries, key=lambda entry: entry[0])
+        last = max(entries, key=lambda entry: entry[0])
+        if last[1] <= first[1]:
+            return 0.0
+        return (last[0] - first[0]) / (last[1] - first[1])
+
+    def latest(self):
+        """Return (seq, timestamp, frame) of the newest frame, or None before the first capture"""
+        seq = self._seq
+        if seq < 0:
+            return None
+        return self._slots[seq % self.buffer_size]
+
+    def get(self, seq):
+        """Return a specific frame if it has not been overwritten yet"""
+        entry = self._slots[seq % self.buffer_size]
+        if entry is None or entry[0] != seq:
+            return None
+        return entry
+
+    def wait_next(self, after_seq=None, timeout=1.0):
+        """Block until a frame newer than after_seq is published; frames are shared and must not be modified"""
+        if after_seq is None:
+            after_seq = self._seq
+        deadline = time.monotonic() + timeout
+        with self._new_frame:
+            while self._seq <= after_seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._new_frame.wait(remaining)
+        return self.latest()
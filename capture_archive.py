@@ -0,0 +1,177 @@
+# capture_archive.py
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+# File name prefix of evidence crops per transaction column; files are named <prefix>_<transaction ids>_<time>.jpg,
+# with the ids as '12' or, for one image shared by a batch, the span '12-14'
+EVIDENCE_COLUMNS = {'issue': 'issue_face_path', 'return': 'return_face_path'}
+
+class CaptureArchiver:
+    def __init__(self, get_connection, directory='face_images', quality=85, margin=0.3,
+                 max_bytes=256 * 1024 * 1024, max_age_days=365, max_queue=64, evict_interval=3600):
+        """Write face crops as evidence JPEGs on a background thread and record their paths on the transaction.
+        The directory is kept under max_bytes and max_age_days by deleting the oldest images first, down to
+        90% of max_bytes so a full directory is not rescanned after every write"""
+        self.get_connection = get_connection
+        self.directory = directory
+        self.quality = quality
+        self.margin = margin
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.evict_interval = evict_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._bytes = None
+        self._last_eviction = 0.0
+        self.written = 0
+        self.dropped = 0
+        self.evicted = 0
+        self._thread = threading.Thread(target=self._run, name="capture-archiver", daemon=True)
+        self._thread.start()
+
+    def crop(self, frame_rgb, face_location):
+        top, right, bottom, left = face_location
+        h, w = frame_rgb.shape[:2]
+        mx = int((right - left) * self.margin)
+        my = int((bottom - top) * self.margin)
+        return frame_rgb[max(0, top - my):min(h, bottom + my), max(0, left - mx):min(w, right + mx)]
+
+    def archive_capture(self, capture, transaction_ids=(), kind=None):
+        """archive() for a (frame_rgb, face_location) capture from wait_for_face or capture_burst. Those frames
+        are channel-swapped copies of the camera frame; the crop is swapped back so it gets the same single
+        conversion as camera frames and the MJPEG stream"""
+        frame_rgb, face_location = capture
+        # A view; only the crop is copied by archive()
+        return self.archive(frame_rgb[..., ::-1], face_location, transaction_ids, kind)
+
+    def archive(self, frame_rgb, face_location=None, transaction_ids=(), kind=None):
+        """Queue the face region (or the whole frame) for writing without blocking; with transactions and a
+        kind ('issue' or 'return') the path is recorded on each of them, so a batch shares one image.
+        Returns the path the image will get, or None if the archiver is too far behind and the image was dropped"""
+        transaction_ids = sorted(transaction_ids)
+        if kind is not None and kind not in EVIDENCE_COLUMNS:
+            raise ValueError(f"Unknown evidence kind: {kind}")
+        if kind is not None and not transaction_ids:
+            raise ValueError("Evidence needs at least one transaction")
+        image = self.crop(frame_rgb, face_location) if face_location is not None else frame_rgb
+        if kind is None:
+            name = "capture_"
+        elif len(transaction_ids) == 1:
+            name = f"{kind}_{transaction_ids[0]}_"
+        else:
+            name = f"{kind}_{transaction_ids[0]}-{transaction_ids[-1]}_"
+        path = os.path.join(self.directory, f"{name}{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jpg")
+        try:
+            # The slice is copied so the camera ring buffer can reuse the frame
+            self._queue.put_nowait((path, image.copy(), transaction_ids, kind))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return path
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    @property
+    def disk_bytes(self):
+        return self._bytes or 0
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far has been written"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _run(self):
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            self.evict()
+        except Exception as e:
+            print(f"Capture archiver error: {e}")
+        while True:
+            try:
+                item = self._queue.get(timeout=self.evict_interval)
+            except queue.Empty:
+                item = None
+            try:
+                if item is not None:
+                    self._write(*item)
+                if (self._bytes is None or self._bytes > self.max_bytes
+                        or time.monotonic() - self._last_eviction > self.evict_interval):
+                    self.evict()
+            except Exception as e:
+                print(f"Capture archiver error: {e}")
+            finally:
+                if item is not None:
+                    self._queue.task_done()
+
+    def _write(self, path, image_rgb, transaction_ids, kind):
+        import cv2
+        ok, buffer = cv2.imencode('.jpg', cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR),
+                                  [int(cv2.IMWRITE_JPEG_QUALITY), int(self.quality)])
+        if not ok:
+            raise RuntimeError(f"Could not encode {path}")
+        with open(path, 'wb') as f:
+            f.write(buffer.tobytes())
+        self.written += 1
+        if self._bytes is not None:
+            self._bytes += len(buffer)
+        if kind is not None:
+            conn = self.get_connection()
+            try:
+                with conn:
+                    conn.execute(f'UPDATE transactions SET {EVIDENCE_COLUMNS[kind]}=? WHERE transaction_id IN '
+                                 f'({",".join("?" * len(transaction_ids))})', (path, *transaction_ids))
+            finally:
+                conn.close()
+
+    def evict(self):
+        """Delete images past max_age, then the oldest ones until the directory fits in max_bytes; the
+        transaction columns pointing at deleted images are cleared"""
+        self._last_eviction = time.monotonic()
+        files = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.lower().endswith('.jpg'):
+                    st = entry.stat()
+                    files.append((st.st_mtime, st.st_size, entry.path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        cutoff = time.time() - self.max_age
+        removed = []
+        target = self.max_bytes if total <= self.max_bytes else int(self.max_bytes * 0.9)
+        for mtime, size, path in files:
+            if mtime >= cutoff and total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed.append(path)
+        self._bytes = total
+        if not removed:
+            return 0
+        self.evicted += len(removed)
+        # The transactions are in the file name, so clearing their column is a primary key range update;
+        # the path check leaves any transaction in the span that points at another image alone
+        updates = {}
+        for path in removed:
+            kind, span, _ = (os.path.basename(path).split('_', 2) + ['', ''])[:3]
+            first, _, last = span.partition('-')
+            last = last or first
+            if kind in EVIDENCE_COLUMNS and first.isdigit() and last.isdigit():
+                updates.setdefault(EVIDENCE_COLUMNS[kind], []).append((int(first), int(last), path))
+        if updates:
+            conn = self.get_connection()
+            try:
+                with conn:
+                    for column, rows in updates.items():
+                        conn.executemany(f'UPDATE transactions SET {column}=NULL '
+                                         f'WHERE transaction_id BETWEEN ? AND ? AND {column}=?', rows)
+            finally:
+                conn.close()
+        return len(removed)
@@ -0,0 +1,133 @@
+# db_pool.py
+import sqlite3
+import threading
+import time
+
+class PooledConnection:
+    def __init__(self, pool, conn):
+        """sqlite3 connection handed out by ConnectionPool; close() returns it to the pool"""
+        self._pool = pool
+        self._conn = conn
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._pool._release(self._conn)
+
+    def __del__(self):
+        # Safety net for code paths that return early without close()
+        if not self._closed:
+            self.close()
+
+class ConnectionPool:
+    def __init__(self, db_name, max_connections=8, busy_timeout_ms=5000, cache_size_kb=8192,
+                 mmap_size=64 * 1024 * 1024, cached_statements=256, acquire_timeout=10.0):
+        """Reusable WAL-mode SQLite connections with tuned pragmas and a per-connection statement cache"""
+        self.db_name = db_name
+        self.max_connections = max_connections
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self.acquire_timeout = acquire_timeout
+        self._idle = []
+        self._count = 0
+        self._cond = threading.Condition()
+        self._stats = {"checkouts": 0, "hits": 0, "opened": 0, "waits": 0,
+                       "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_name, timeout=self.busy_timeout_ms / 1000,
+                               check_same_thread=False, cached_statements=self.cached_statements)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+
+    def connection(self):
+        """Check out a connection, waiting if max_connections are all in use"""
+        start = time.perf_counter()
+        waited = False
+        with self._cond:
+            while not self._idle and self._count >= self.max_connections:
+                waited = True
+                remaining = self.acquire_timeout - (time.perf_counter() - start)
+                if remaining <= 0:
+                    raise sqlite3.OperationalError("Timed out waiting for a database connection")
+                self._cond.wait(remaining)
+            self._stats["checkouts"] += 1
+            if self._idle:
+                conn = self._idle.pop()
+                self._stats["hits"] += 1
+            else:
+                conn = None
+                self._count += 1
+            if waited:
+                wait_ms = (time.perf_counter() - start) * 1000
+                self._stats["waits"] += 1
+                self._stats["wait_ms_total"] += wait_ms
+                self._stats["wait_ms_max"] = max(self._stats["wait_ms_max"], wait_ms)
+
+        if conn is None:
+            try:
+                conn = self._open()
+            except Exception:
+                with self._cond:
+                    self._count -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats["opened"] += 1
+        return PooledConnection(self, conn)
+
+    def dedicated(self):
+        """Open a read-only connection outside the pool, with the same pragmas, for readers that may hold it
+        as long as a client takes to download; the caller closes it"""
+        conn = self._open()
+        conn.execute('PRAGMA query_only=1')
+        return conn
+
+    def _release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._cond:
+                self._count -= 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def close_all(self):
+        with self._cond:
+            for conn in self._idle:
+                conn.close()
+            self._count -= len(self._idle)
+            self._idle = []
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["connections"] = self._count
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._count - len(self._idle)
+        stats["hit_rate"] = round(stats["hits"] / stats["checkouts"], 4) if stats["checkouts"] else 0.0
+        stats["wait_ms_avg"] = round(stats["wait_ms_total"] / stats["waits"], 3) if stats["waits"] else 0.0
+        return stats
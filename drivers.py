@@ -0,0 +1,125 @@
+# drivers.py
+import glob
+import os
+import queue
+import time
+
+# Camera drivers provide start(), stop() and capture_array() returning an RGB frame.
+# RFID drivers provide read_rfid() -> (tag, text) and write_rfid(text), like rfid_module.RFIDReader.
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+def make_pi_camera(size=(640, 480), camera_num=0):
+    """The Pi camera module; picamera2 is only imported when a real camera is requested"""
+    from picamera2 import Picamera2
+    camera = Picamera2(camera_num)
+    camera.configure(camera.create_preview_configuration(main={"size": size}))
+    return camera
+
+class ReplayCamera:
+    def __init__(self, source, fps=30, loop=True, size=None):
+        """Play back a directory of images or a video file as a live camera, paced at fps"""
+        self.source = source
+        self.fps = fps
+        self.loop = loop
+        self.size = size
+        self.frames = self._load(source)
+        if not self.frames:
+            raise ValueError(f"No frames found in {source}")
+        self._index = 0
+        self._next_due = 0.0
+
+    def _load(self, source):
+        import cv2
+        if os.path.isdir(source):
+            paths = sorted(p for p in glob.glob(os.path.join(source, '*')) if p.lower().endswith(IMAGE_EXTENSIONS))
+            images = (cv2.imread(p) for p in paths)
+        else:
+            capture = cv2.VideoCapture(source)
+            images = []
+            while True:
+                ok, image = capture.read()
+                if not ok:
+                    break
+                images.append(image)
+            capture.release()
+        frames = []
+        for image in images:
+            if image is None:
+                continue
+            if self.size:
+                image = cv2.resize(image, tuple(self.size), interpolation=cv2.INTER_AREA)
+            # Fixtures are stored BGR on disk; deliver RGB like the Pi camera
+            frames.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        return frames
+
+    def start(self):
+        self._next_due = time.monotonic()
+
+    def stop(self):
+        pass
+
+    def capture_array(self):
+        if self.fps:
+            delay = self._next_due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            self._next_due = max(self._next_due, time.monotonic() - 1.0) + 1.0 / self.fps
+        if self._index >= len(self.frames):
+            if not self.loop:
+                raise RuntimeError("Replay finished")
+            self._index = 0
+        frame = self.frames[self._index]
+        self._index += 1
+        return frame
+
+class ScriptedRFIDReader:
+    def __init__(self, tags=(), timeout=None, read_delay=0.0):
+        """Hand out a scripted stream of tags; read_rfid() returns (None, None) once nothing arrives within timeout"""
+        self.timeout = timeout
+        self.read_delay = read_delay
+        self._tags = queue.Queue()
+        self.written = []
+        for tag in tags:
+            self.present(tag)
+
+    def present(self, tag, text=''):
+        """Place a tag on the reader; it is consumed by the next read"""
+        self._tags.put((tag, text))
+
+    def read_rfid(self):
+        if self.read_delay:
+            time.sleep(self.read_delay)
+        try:
+            return self._tags.get(timeout=self.timeout)
+        except queue.Empty:
+            return None, None
+
+    def write_rfid(self, text):
+        self.written.append(text)
+
+def make_camera(spec=None):
+    """Camera from a spec: 'pi[:<camera number>]' (default) or 'replay:<image dir or video file>[@fps]'"""
+    spec = spec or os.environ.get('LMS_CAMERA', 'pi')
+    if spec == 'pi' or spec.startswith('pi:'):
+        return make_pi_camera(camera_num=int(spec[3:] or 0))
+    if spec.startswith('replay:'):
+        source, _, fps = spec[len('replay:'):].partition('@')
+        return ReplayCamera(source, fps=float(fps) if fps else 30)
+    raise ValueError(f"Unknown camera driver: {spec}")
+
+def make_rfid_reader(spec=None):
+    """RFID reader from a spec: 'mfrc522' (default) or 'script:<file with one tag per line, or tag,tag,...>'"""
+    spec = spec or os.environ.get('LMS_RFID', 'mfrc522')
+    if spec == 'mfrc522':
+        from rfid_module import RFIDReader
+        return RFIDReader()
+    if spec.startswith('script:'):
+        script = spec[len('script:'):]
+        if os.path.isfile(script):
+            with open(script) as f:
+                tags = [line.strip() for line in f if line.strip()]
+        else:
+            tags = [tag for tag in script.split(',') if tag]
+        return ScriptedRFIDReader(tags, timeout=10.0)
+    raise ValueError(f"Unknown RFID driver: {spec}")
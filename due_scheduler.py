@@ -0,0 +1,134 @@
+# due_scheduler.py
+import heapq
+import threading
+import time
+from datetime import datetime, timedelta
+from metrics import registry
+from queries import DUE_LOAD
+
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def _epoch(text):
+    return datetime.strptime(text, DATE_FORMAT).timestamp()
+
+def _text(epoch):
+    return datetime.fromtimestamp(epoch).strftime(DATE_FORMAT)
+
+class DueDateScheduler:
+    def __init__(self, get_connection, audit=None, reminder_before=timedelta(days=2), listeners=None, retry_delay=30.0):
+        """Min-heap of reminder and overdue events for active loans, fired by one background thread.
+        The fire time of the last processed event is persisted, so a restart only loads loans due after it;
+        a batch that cannot be recorded goes back on the heap and is retried after retry_delay seconds"""
+        self.get_connection = get_connection
+        self.audit = audit
+        self.reminder_before = reminder_before.total_seconds()
+        # Called as listener(kind, transaction_id) after an event was recorded
+        self.listeners = list(listeners or [])
+        self._heap = []
+        self._loans = set()
+        self.retry_delay = retry_delay
+        self._retry_at = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+        self.fired = {"reminder": 0, "overdue": 0}
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="due-scheduler", daemon=True)
+        self._thread.start()
+
+    def _push(self, transaction_id, due, cursor=0.0):
+        # One entry per event; returned loans are not removed but skipped when their event comes up
+        if transaction_id in self._loans:
+            return
+        self._loans.add(transaction_id)
+        heapq.heappush(self._heap, (due, 'overdue', transaction_id))
+        if due - self.reminder_before > cursor:
+            heapq.heappush(self._heap, (due - self.reminder_before, 'reminder', transaction_id))
+
+    def schedule(self, transaction_id, due_date):
+        """Track a new loan; due_date is the stored 'YYYY-MM-DD HH:MM:SS' text"""
+        with self._cond:
+            self._push(transaction_id, _epoch(due_date), time.time())
+            self._cond.notify()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _load(self):
+        conn = self.get_connection()
+        try:
+            row = conn.execute("SELECT fired_through FROM scheduler_cursor WHERE name='due_dates'").fetchone()
+            cursor = row[0] if row else '0000-00-00 00:00:00'
+            rows = conn.execute(DUE_LOAD, (cursor,)).fetchall()
+        finally:
+            conn.close()
+        cursor_epoch = _epoch(cursor) if row else 0.0
+        with self._cond:
+            for transaction_id, due_date in rows:
+                self._push(transaction_id, _epoch(due_date), cursor_epoch)
+        print(f"Due-date scheduler loaded {len(rows)} loans due after {cursor}")
+
+    def _run(self):
+        try:
+            self._load()
+        except Exception as e:
+            print(f"Due-date scheduler load error: {e}")
+        while True:
+            with self._cond:
+                while not self._heap or max(self._heap[0][0], self._retry_at) > time.time():
+                    self._cond.wait(None if not self._heap
+                                    else min(max(self._heap[0][0], self._retry_at) - time.time(), 3600))
+                now = time.time()
+                events = []
+                while self._heap and self._heap[0][0] <= now:
+                    events.append(heapq.heappop(self._heap))
+                    if events[-1][1] == 'overdue':
+                        self._loans.discard(events[-1][2])
+            try:
+                self._fire(events)
+            except Exception as e:
+                # Nothing was committed, so the cursor has not moved past these events either
+                print(f"Due-date scheduler error, retrying in {self.retry_delay:.0f}s: {e}")
+                with self._cond:
+                    for event in events:
+                        heapq.heappush(self._heap, event)
+                        if event[1] == 'overdue':
+                            self._loans.add(event[2])
+                    self._retry_at = time.time() + self.retry_delay
+
+    def _fire(self, events):
+        """Record a batch of due events in one transaction and advance the persisted cursor past them"""
+        overdue = [tid for _, kind, tid in events if kind == 'overdue']
+        reminders = [tid for _, kind, tid in events if kind == 'reminder']
+        conn = self.get_connection()
+        try:
+            with conn:
+                marked = [tid for tid in overdue if conn.execute(
+                    "UPDATE transactions SET overdue=1 WHERE transaction_id=? AND status='issued' AND overdue=0",
+                    (tid,)).rowcount]
+                if reminders:
+                    active = {r[0] for r in conn.execute(
+                        f"SELECT transaction_id FROM transactions WHERE status='issued' AND transaction_id IN "
+                        f"({','.join('?' * len(reminders))})", reminders)}
+                    reminders = [tid for tid in reminders if tid in active]
+                conn.execute('''INSERT INTO scheduler_cursor (name, fired_through) VALUES ('due_dates', ?)
+                                ON CONFLICT(name) DO UPDATE SET fired_through = excluded.fired_through''',
+                             (_text(events[-1][0]),))
+        finally:
+            conn.close()
+        for kind, fired in (('reminder', reminders), ('overdue', marked)):
+            if not fired:
+                continue
+            self.fired[kind] += len(fired)
+            registry.inc('lms_due_events_total', len(fired), kind=kind)
+            for tid in fired:
+                if self.audit is not None:
+                    self.audit.log(f"due_{kind}", tid)
+                for listener in self.listeners:
+                    # The events are committed; a failing listener must not get them retried
+                    try:
+                        listener(kind, tid)
+                    except Exception as e:
+                        print(f"Due-date listener error: {e}")
@@ -0,0 +1,38 @@
+# encoding_format.py
+import struct
+import numpy as np
+
+# Versioned face_encoding BLOB layout:
+#   magic 'FE' | version u8 | kind u8 | dim u16 | pad u16 | scale f32 | payload
+# The 12-byte header keeps the float32 payload 4-byte aligned for np.frombuffer.
+MAGIC = b'FE'
+VERSION = 1
+KIND_FLOAT32 = 0
+KIND_INT8 = 1
+HEADER = struct.Struct('<2sBBHxxf')
+
+def encode_encoding(encoding, quantize=False):
+    """Serialize a face encoding as raw float32 (or int8 with a per-vector scale)"""
+    vec = np.asarray(encoding, dtype=np.float32).ravel()
+    if quantize:
+        peak = float(np.abs(vec).max())
+        scale = peak / 127.0 if peak > 0 else 1.0
+        payload = np.clip(np.rint(vec / scale), -127, 127).astype(np.int8)
+        return HEADER.pack(MAGIC, VERSION, KIND_INT8, len(vec), scale) + payload.tobytes()
+    return HEADER.pack(MAGIC, VERSION, KIND_FLOAT32, len(vec), 1.0) + vec.tobytes()
+
+def is_encoded(blob):
+    return blob is not None and len(blob) >= HEADER.size and bytes(blob[:2]) == MAGIC
+
+def decode_encoding(blob):
+    """Return a float32 vector; float32 payloads are a zero-copy view of the BLOB"""
+    if not is_encoded(blob):
+        raise ValueError("Unsupported face encoding format (run database_setup.py to apply migrations)")
+    _, version, kind, dim, scale = HEADER.unpack_from(blob)
+    if version != VERSION:
+        raise ValueError(f"Unsupported face encoding version {version}")
+    if kind == KIND_FLOAT32:
+        return np.frombuffer(blob, dtype=np.float32, count=dim, offset=HEADER.size)
+    if kind == KIND_INT8:
+        return np.frombuffer(blob, dtype=np.int8, count=dim, offset=HEADER.size).astype(np.float32) * np.float32(scale)
+    raise ValueError(f"Unsupported face encoding kind {kind}")
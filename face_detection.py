@@ -0,0 +1,180 @@
+# face_detection.py
+import time
+import cv2
+
+# All detectors take an RGB image and return face_recognition style (top, right, bottom, left) boxes.
+# face_recognition loads the dlib models on import, so it is only imported where dlib runs in this process
+
+class HOGDetector:
+    name = 'hog'
+
+    def __init__(self, upsample=1):
+        self.upsample = upsample
+
+    def detect(self, rgb_image):
+        import face_recognition
+        return face_recognition.face_locations(rgb_image, number_of_times_to_upsample=self.upsample, model='hog')
+
+class CNNDetector(HOGDetector):
+    name = 'cnn'
+
+    def detect(self, rgb_image):
+        import face_recognition
+        return face_recognition.face_locations(rgb_image, number_of_times_to_upsample=self.upsample, model='cnn')
+
+class HaarDetector:
+    name = 'haar'
+
+    def __init__(self, cascade_path=None, scale_factor=1.1, min_neighbors=5, min_size=(30, 30)):
+        if cascade_path is None:
+            cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = min_size
+
+    def detect(self, rgb_image):
+        gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+        boxes = self.cascade.detectMultiScale(gray, scaleFactor=self.scale_factor,
+                                              minNeighbors=self.min_neighbors, minSize=self.min_size)
+        return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in boxes]
+
+class DNNDetector:
+    name = 'dnn'
+
+    def __init__(self, prototxt='models/deploy.prototxt',
+                 weights='models/res10_300x300_ssd_iter_140000.caffemodel', confidence=0.6):
+        """OpenCV SSD face detector; model files are not bundled and must be downloaded separately"""
+        self.net = cv2.dnn.readNetFromCaffe(prototxt, weights)
+        self.confidence = confidence
+
+    def detect(self, rgb_image):
+        h, w = rgb_image.shape[:2]
+        blob = cv2.dnn.blobFromImage(cv2.resize(rgb_image, (300, 300)), 1.0, (300, 300),
+                                     (123.0, 177.0, 104.0), swapRB=False)
+        self.net.setInput(blob)
+        detections = self.net.forward()
+        boxes = []
+        for i in range(detections.shape[2]):
+            if detections[0, 0, i, 2] < self.confidence:
+                continue
+            x1, y1, x2, y2 = detections[0, 0, i, 3:7] * [w, h, w, h]
+            boxes.append((max(0, int(y1)), min(w, int(x2)), min(h, int(y2)), max(0, int(x1))))
+        return boxes
+
+class PrefilterDetector:
+    def __init__(self, prefilter, detector):
+        """Run a cheap detector first and only pay for the accurate one when it sees a face"""
+        self.prefilter = prefilter
+        self.detector = detector
+        self.name = f"{prefilter.name}+{detector.name}"
+
+    def detect(self, rgb_image):
+        if not self.prefilter.detect(rgb_image):
+            return []
+        return self.detector.detect(rgb_image)
+
+DETECTORS = {
+    'hog': HOGDetector,
+    'cnn': CNNDetector,
+    'haar': HaarDetector,
+    'dnn': DNNDetector,
+}
+
+class PooledDetector:
+    def __init__(self, pool, model='hog', upsample=1):
+        """HOG/CNN detection run in a vision_pool.VisionPool worker, so the caller waits without holding the GIL"""
+        self.pool = pool
+        self.model = model
+        self.upsample = upsample
+        self.name = model
+
+    def detect(self, rgb_image):
+        return self.pool.face_locations(rgb_image, self.model, self.upsample).result()
+
+def make_detector(name, pool=None):
+    """Build a detector from a name such as 'hog', 'haar' or 'haar+hog'; with a vision pool, dlib detectors
+    run in its worker processes"""
+    if '+' in name:
+        prefilter, detector = name.split('+', 1)
+        return PrefilterDetector(make_detector(prefilter, pool), make_detector(detector, pool))
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown face detector: {name}")
+    if pool is not None and name in ('hog', 'cnn'):
+        return PooledDetector(pool, name)
+    return DETECTORS[name]()
+
+class FaceDetectionPipeline:
+    def __init__(self, detector, scale=0.5, roi_margin=0.6, roi_ttl=1.0):
+        """Detect on a downscaled frame, reusing the previous face region when it is recent"""
+        self.detector = detector
+        self.scale = scale
+        self.roi_margin = roi_margin
+        self.roi_ttl = roi_ttl
+        self._roi = None
+        self._roi_time = 0.0
+        self.last_timings = {}
+        self.stats = {}
+
+    def _record(self, stage, start):
+        elapsed = (time.perf_counter() - start) * 1000
+        self.last_timings[stage] = elapsed
+        count, total = self.stats.get(stage, (0, 0.0))
+        self.stats[stage] = (count + 1, total + elapsed)
+
+    def _detect_scaled(self, rgb_image, offset_x=0, offset_y=0):
+        start = time.perf_counter()
+        if self.scale != 1.0:
+            small = cv2.resize(rgb_image, (0, 0), fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        else:
+            small = rgb_image
+        self._record('resize', start)
+
+        start = time.perf_counter()
+        boxes = self.detector.detect(small)
+        self._record('detect', start)
+
+        inv = 1.0 / self.scale
+        h, w = rgb_image.shape[:2]
+        return [(min(h, int(top * inv)) + offset_y, min(w, int(right * inv)) + offset_x,
+                 min(h, int(bottom * inv)) + offset_y, min(w, int(left * inv)) + offset_x)
+                for top, right, bottom, left in boxes]
+
+    def _roi_window(self, shape):
+        top, right, bottom, left = self._roi
+        h, w = shape[:2]
+        mx = int((right - left) * self.roi_margin)
+        my = int((bottom - top) * self.roi_margin)
+        return max(0, top - my), min(w, right + mx), min(h, bottom + my), max(0, left - mx)
+
+    def reset(self):
+        self._roi = None
+
+    def detect(self, rgb_image):
+        """Return full-resolution face boxes for an RGB frame"""
+        self.last_timings = {}
+        start = time.perf_counter()
+        boxes = []
+        used_roi = False
+
+        if self._roi is not None and time.monotonic() - self._roi_time < self.roi_ttl:
+            top, right, bottom, left = self._roi_window(rgb_image.shape)
+            boxes = self._detect_scaled(rgb_image[top:bottom, left:right], offset_x=left, offset_y=top)
+            used_roi = bool(boxes)
+
+        if not used_roi:
+            boxes = self._detect_scaled(rgb_image)
+
+        if len(boxes) == 1:
+            self._roi = boxes[0]
+            self._roi_time = time.monotonic()
+        else:
+            self._roi = None
+
+        self._record('total', start)
+        self.last_timings['roi'] = used_roi
+        return boxes
+
+    def timing_report(self):
+        """Average milliseconds per stage since startup"""
+        return {stage: round(total / count, 2) for stage, (count, total) in self.stats.items() if count}
@@ -0,0 +1,201 @@
+# face_gallery.py
+import os
+import threading
+import numpy as np
+from ann_index import IVFIndex, suggested_nlist
+from encoding_format import decode_encoding
+from queries import GALLERY_LOAD
+
+class FaceGallery:
+    def __init__(self, dim=128):
+        """Resident matrix of active user encodings for 1:N identification"""
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._matrix = np.empty((0, dim), dtype=np.float32)
+        self._sq_norms = np.empty(0, dtype=np.float32)
+        self._user_ids = np.empty(0, dtype=np.int64)
+        self._names = []
+        self._rows = {}
+        self._size = 0
+        self.ann = None
+        self.ann_path = None
+        self.ann_min_size = 0
+        self._ann_dirty = False
+        self.ann_save_delay = 30.0
+        self._save_timer = None
+        self._timer_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def enable_ann(self, path, nprobe=8, min_size=5000):
+        """Serve identification from an IVF index persisted at path once the gallery is large enough"""
+        self.ann_path = path
+        self.ann_min_size = min_size
+        if os.path.exists(path):
+            self.ann = IVFIndex.load(path)
+            self.ann.nprobe = nprobe
+        else:
+            self.ann = IVFIndex(dim=self.dim, nprobe=nprobe)
+        if self._size:
+            self._sync_ann()
+
+    def _sync_ann(self):
+        """Bring the ANN index in line with the gallery rows without retraining when possible"""
+        with self._lock:
+            n = self._size
+            if not self.ann.is_trained or len(self.ann) * 4 < n:
+                self.ann.nlist = suggested_nlist(n)
+                self.ann.build(self._user_ids[:n], self._matrix[:n])
+                self._ann_dirty = True
+            else:
+                indexed = self.ann.ids()
+                stale = indexed - set(self._rows)
+                for uid in stale:
+                    self.ann.remove(uid)
+                missing = [uid for uid in self._rows if uid not in indexed]
+                for uid in missing:
+                    self.ann.add(uid, self._matrix[self._rows[uid]])
+                self._ann_dirty = bool(stale or missing)
+        print(f"ANN index ready: {len(self.ann)} vectors in {self.ann.nlist} lists")
+        self.save_ann()
+
+    def save_ann(self):
+        """Persist the ANN index in the background if it changed; changes within ann_save_delay seconds are
+        written together. Changes lost to a crash are harmless, the next load re-syncs the index with the users"""
+        if self.ann is None or not self._ann_dirty or not self.ann_path:
+            return
+        with self._timer_lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.ann_save_delay, self.flush_ann)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def flush_ann(self):
+        """Write the ANN index now if it changed; identification is only blocked while it is copied"""
+        with self._timer_lock:
+            self._save_timer = None
+        with self._write_lock:
+            with self._lock:
+                if self.ann is None or not self._ann_dirty or not self.ann_path:
+                    return
+                snapshot = self.ann.snapshot()
+                self._ann_dirty = False
+            try:
+                self.ann.save(self.ann_path, snapshot)
+            except Exception as e:
+                self._ann_dirty = True
+                print(f"ANN index save error: {e}")
+
+    def load(self, conn):
+        """Load all active users from the database in one pass"""
+        cur = conn.cursor()
+        cur.execute(GALLERY_LOAD)
+        rows = cur.fetchall()
+
+        matrix = np.zeros((max(len(rows), 16), self.dim), dtype=np.float32)
+        user_ids = np.zeros(matrix.shape[0], dtype=np.int64)
+        names = []
+        for i, (uid, uname, enc) in enumerate(rows):
+            matrix[i] = decode_encoding(enc)
+            user_ids[i] = uid
+            names.append(uname)
+
+        with self._lock:
+            self._matrix = matrix
+            self._user_ids = user_ids
+            self._sq_norms = np.einsum('ij,ij->i', matrix, matrix)
+            self._names = names
+            self._rows = {int(uid): i for i, uid in enumerate(user_ids[:len(rows)])}
+            self._size = len(rows)
+        print(f"Face gallery loaded: {len(rows)} users")
+        if self.ann is not None:
+            self._sync_ann()
+
+    def _grow(self):
+        capacity = max(16, self._matrix.shape[0] * 2)
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        user_ids = np.empty(capacity, dtype=np.int64)
+        user_ids[:self._size] = self._user_ids[:self._size]
+        self._matrix, self._sq_norms, self._user_ids = matrix, sq_norms, user_ids
+
+    def add(self, user_id, name, encoding):
+        """Insert or replace a single user's encoding"""
+        vec = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            row = self._rows.get(user_id)
+            if row is None:
+                if self._size == self._matrix.shape[0]:
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._names.append(name)
+                self._rows[user_id] = row
+            else:
+                self._names[row] = name
+            self._matrix[row] = vec
+            self._sq_norms[row] = vec.dot(vec)
+            self._user_ids[row] = user_id
+            if self.ann is not None and self.ann.is_trained:
+                self.ann.add(user_id, vec)
+                self._ann_dirty = True
+
+    def remove(self, user_id):
+        """Drop a user by moving the last row into its slot"""
+        with self._lock:
+            row = self._rows.pop(user_id, None)
+            if row is None:
+                return False
+            last = self._size - 1
+            if row != last:
+                self._matrix[row] = self._matrix[last]
+                self._sq_norms[row] = self._sq_norms[last]
+                self._user_ids[row] = self._user_ids[last]
+                self._names[row] = self._names[last]
+                self._rows[int(self._user_ids[row])] = row
+            self._names.pop()
+            self._size = last
+            if self.ann is not None and self.ann.remove(user_id):
+                self._ann_dirty = True
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._rows = {}
+            self._names = []
+            self._size = 0
+            if self.ann is not None:
+                self.ann.build([], np.empty((0, self.dim), dtype=np.float32))
+                self._ann_dirty = True
+
+    def distances(self, encoding):
+        """Return (user_ids, names, distances) for every active user"""
+        q = np.asarray(encoding, dtype=np.float32).reshape(self.dim)
+        with self._lock:
+            n = self._size
+            d2 = self._sq_norms[:n] - 2.0 * (self._matrix[:n] @ q) + q.dot(q)
+            user_ids = self._user_ids[:n].copy()
+            names = list(self._names)
+        return user_ids, names, np.sqrt(np.maximum(d2, 0.0))
+
+    def best_match(self, encoding, tolerance=0.6):
+        """Return (user_id, name, distance) of the closest user, or None if none within tolerance"""
+        if self.ann is not None and self.ann.is_trained and self._size >= self.ann_min_size:
+            with self._lock:
+                ids, dist = self.ann.search(encoding, k=1)
+                if len(ids) == 0 or dist[0] > tolerance:
+                    return None
+                user_id = int(ids[0])
+                return user_id, self._names[self._rows[user_id]], float(dist[0])
+
+        user_ids, names, dist = self.distances(encoding)
+        if len(dist) == 0:
+            return None
+        best = int(np.argmin(dist))
+        if dist[best] > tolerance:
+            return None
+        return int(user_ids[best]), names[best], float(dist[best])
@@ -1,34 +1,189 @@
 # face_recognition_module.py
-import face_recognition
 import cv2
 import numpy as np
 import pickle
-from picamera2 import Picamera2
 from datetime import datetime
 import os
+from camera_stream import CameraStream
+from drivers import make_camera
+from face_detection import FaceDetectionPipeline, make_detector
+from metrics import registry
+import time
+
+# Operator-facing messages for wait_for_face() outcomes
+CAPTURE_MESSAGES = {
+    "no_face": "No face detected!",
+    "multiple_faces": "Multiple faces detected!",
+    "too_small": "Please move closer to the camera!",
+    "blurry": "Hold still, image is blurry!",
+    "pose": "Please face the camera directly!",
+    "no_frames": "Camera not delivering frames!",
+}
+
+def face_distance(encodings, known_encoding):
+    """Euclidean distances as face_recognition.face_distance, without importing dlib into this process"""
+    encodings = np.asarray(encodings, dtype=np.float64).reshape(-1, 128)
+    return np.linalg.norm(encodings - np.asarray(known_encoding, dtype=np.float64), axis=1)
 
 class FaceRecognitionSystem:
-    def __init__(self):
-        """Initialize camera and face recognition system"""
-        self.picam2 = Picamera2()
-        config = self.picam2.create_preview_configuration(
-            main={"size": (640, 480)}
-        )
-        self.picam2.configure(config)
+    capture_messages = CAPTURE_MESSAGES
+    
+    def __init__(self, detector='hog', detection_scale=0.5, camera=None, vision_pool=None, archiver=None):
+        """Initialize camera and face recognition system; camera defaults to the LMS_CAMERA driver (Pi camera).
+        With a vision_pool, detection and encoding run in its worker processes; with a
+        capture_archive.CaptureArchiver, capture_image() saves in the background"""
+        self.vision_pool = vision_pool
+        self.archiver = archiver
+        self.picam2 = camera if camera is not None else make_camera()
         self.picam2.start()
         
+        # One capture thread owns the device; everyone else reads from its ring buffer
+        self.stream = CameraStream(self.picam2)
+        self.stream.start()
+        
+        # Detect on downscaled frames, e.g. detector='haar+hog' to skip HOG on empty frames
+        self.detection = FaceDetectionPipeline(make_detector(detector, vision_pool), scale=detection_scale)
+        
         # Create directory for face images
         if not os.path.exists('face_images'):
             os.makedirs('face_images')
     
+    def get_frame(self, fresh=True, timeout=2.0):
+        """Return the newest camera frame, waiting for one captured after this call if fresh"""
+        entry = self.stream.wait_next(timeout=timeout) if fresh else self.stream.latest()
+        if entry is None:
+            entry = self.stream.wait_next(after_seq=-1, timeout=timeout)
+        if entry is None:
+            raise RuntimeError("Camera not delivering frames")
+        return entry[2]
+    
+    def detect_faces(self, rgb_image):
+        """Return full-resolution face locations using the configured detection pipeline"""
+        face_locations = self.detection.detect(rgb_image)
+        timings = self.detection.last_timings
+        for step, ms in timings.items():
+            if step != 'roi':
+                registry.observe('lms_detection_seconds', ms / 1000.0, step=step, roi=timings['roi'])
+        return face_locations
+    
+    def check_face_quality(self, rgb_image, face_location, min_face_size=80, min_sharpness=40.0, max_yaw=0.35):
+        """Return None if the face passes the size, sharpness and pose gates, else the failing gate"""
+        with registry.timer('face_quality'):
+            return self._face_quality(rgb_image, face_location, min_face_size, min_sharpness, max_yaw)
+    
+    def _face_quality(self, rgb_image, face_location, min_face_size, min_sharpness, max_yaw):
+        top, right, bottom, left = face_location
+        if min(bottom - top, right - left) < min_face_size:
+            return "too_small"
+        
+        gray = cv2.cvtColor(rgb_image[top:bottom, left:right], cv2.COLOR_RGB2GRAY)
+        if cv2.Laplacian(gray, cv2.CV_64F).var() < min_sharpness:
+            return "blurry"
+        
+        # Yaw estimate: horizontal offset of the nose tip from the eye midpoint, relative to eye distance
+        if self.vision_pool is not None:
+            landmarks = self.vision_pool.face_landmarks(rgb_image, [face_location], model='small').result()
+        else:
+            import face_recognition
+            landmarks = face_recognition.face_landmarks(rgb_image, [face_location], model='small')
+        if landmarks:
+            points = landmarks[0]
+            left_eye = np.mean(points['left_eye'], axis=0)
+            right_eye = np.mean(points['right_eye'], axis=0)
+            nose = np.mean(points['nose_tip'], axis=0)
+            eye_span = abs(right_eye[0] - left_eye[0])
+            if eye_span == 0 or abs(nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_span > max_yaw:
+                return "pose"
+        return None
+    
+    def wait_for_face(self, timeout=8.0, reset_roi=True, **gates):
+        """Watch the live stream and return (frame_rgb, face_location, None) as soon as exactly one
+        usable face is in view, or (None, None, reason) on timeout"""
+        deadline = time.monotonic() + timeout
+        seq = None
+        reason = "no_frames"
+        if reset_roi:
+            self.detection.reset()
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"Capture timed out: {reason}")
+                return None, None, reason
+            entry = self.stream.wait_next(seq, timeout=remaining)
+            if entry is None:
+                continue
+            seq, _, frame = entry
+            
+            # Convert RGB to BGR for face_recognition
+            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            face_locations = self.detect_faces(frame_rgb)
+            if len(face_locations) == 0:
+                reason = "no_face"
+                continue
+            if len(face_locations) > 1:
+                reason = "multiple_faces"
+                continue
+            
+            reason = self.check_face_quality(frame_rgb, face_locations[0], **gates)
+            if reason is None:
+                return frame_rgb, face_locations[0], None
+    
+    def capture_burst(self, count=3, timeout=8.0, **gates):
+        """Collect up to count gated (frame_rgb, face_location) captures from consecutive frames"""
+        deadline = time.monotonic() + timeout
+        captures = []
+        reason = None
+        while len(captures) < count:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            frame_rgb, face_location, reason = self.wait_for_face(timeout=remaining, reset_roi=not captures, **gates)
+            if reason:
+                break
+            captures.append((frame_rgb, face_location))
+        print(f"Burst captured {len(captures)}/{count} frames")
+        return captures, (None if captures else reason)
+    
+    def encode_burst(self, captures):
+        """Encode every captured frame and return an (N, 128) array"""
+        if self.vision_pool is not None:
+            # The whole burst is encoded in parallel, one frame per worker
+            futures = [self.vision_pool.face_encodings(frame_rgb, [face_location]) for frame_rgb, face_location in captures]
+            encodings = [face_encodings[0] for face_encodings in (f.result() for f in futures) if face_encodings]
+            return np.array(encodings).reshape(-1, 128)
+        import face_recognition
+        encodings = []
+        for frame_rgb, face_location in captures:
+            with registry.timer('face_encoding'):
+                face_encodings = face_recognition.face_encodings(frame_rgb, [face_location])
+            if face_encodings:
+                encodings.append(face_encodings[0])
+        return np.array(encodings).reshape(-1, 128)
+    
+    def robust_template(self, encodings, max_spread=0.3):
+        """Average the burst after discarding encodings far from its median; returns (template, inliers)"""
+        median = np.median(encodings, axis=0)
+        spread = np.linalg.norm(encodings - median, axis=1)
+        keep = spread <= max_spread
+        if not keep.any():
+            keep = spread == spread.min()
+        return encodings[keep].mean(axis=0), int(keep.sum())
+    
+    def fused_distance(self, known_encoding, encodings):
+        """Median distance of a burst to a known template, so one bad frame cannot flip the decision"""
+        return float(np.median(face_distance(encodings, known_encoding)))
+    
     def capture_image(self, filename=None):
         """Capture image from camera"""
+        # Capture frame
+        frame = self.get_frame()
+        
+        # Without an explicit filename the archiver writes it off the capture path
+        if filename is None and self.archiver is not None:
+            return self.archiver.archive(frame), frame
         if filename is None:
             filename = f"face_images/capture_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
         
-        # Capture frame
-        frame = self.picam2.capture_array()
-        
         # Convert from RGB to BGR for OpenCV
         frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
         
@@ -44,7 +199,7 @@ class FaceRecognitionSystem:
         rgb_image = cv2.cvtColor(image_array, cv2.COLOR_BGR2RGB) if len(image_array.shape) == 3 else image_array
         
         # Detect faces
-        face_locations = face_recognition.face_locations(rgb_image)
+        face_locations = self.detect_faces(rgb_image)
         
         if len(face_locations) == 0:
             print("No face detected!")
@@ -55,7 +210,11 @@ class FaceRecognitionSystem:
             return None
         
         # Get face encoding
-        face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
+        if self.vision_pool is not None:
+            face_encodings = self.vision_pool.face_encodings(rgb_image, face_locations).result()
+        else:
+            import face_recognition
+            face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
         
         if len(face_encodings) > 0:
             print("Face detected and encoded successfully!")
@@ -86,15 +245,14 @@ class FaceRecognitionSystem:
             return False, filename
         
         # Compare faces
-        matches = face_recognition.compare_faces([known_encoding], current_encoding, tolerance=tolerance)
-        
-        # Calculate face distance
-        face_distance = face_recognition.face_distance([known_encoding], current_encoding)
+        distance = face_distance([current_encoding], known_encoding)[0]
+        match = bool(distance <= tolerance)
         
-        print(f"Face match: {matches[0]}, Distance: {face_distance[0]:.2f}")
+        print(f"Face match: {match}, Distance: {distance:.2f}")
         
-        return matches[0], filename
+        return match, filename
     
     def cleanup(self):
         """Stop camera"""
+        self.stream.stop()
         self.picam2.stop()
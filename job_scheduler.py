@@ -0,0 +1,149 @@
+# job_scheduler.py
+import itertools
+import queue
+import threading
+import time
+from collections import OrderedDict
+from metrics import registry, SamplingProfiler
+
+class QueueFull(Exception):
+    pass
+
+class Job:
+    def __init__(self, job_id, kind, fn, args, resources, scheduler, profile=False):
+        """One queued hardware transaction and its own status"""
+        self.id = job_id
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        self.resources = tuple(sorted(resources))
+        self.scheduler = scheduler
+        self.state = "queued"
+        self.status = "queued"
+        self.message = "Waiting for device..."
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.profile = profile
+        self.profile_output = None
+        self.done = threading.Event()
+
+    def update(self, status, message):
+        """Record a step of the transaction, e.g. job.update("reading_rfid", "Reading RFID...")"""
+        self.status = status
+        self.message = message
+        self.scheduler._publish(self)
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "status": self.status,
+            "message": self.message,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "profiled": self.profile_output is not None,
+            "station": self.scheduler.station,
+        }
+
+class JobScheduler:
+    def __init__(self, workers=2, max_queue=16, history=200, ids=None, station=None):
+        """Bounded job queue whose workers hold explicit per-device locks while a job runs.
+        Lanes that share an ids counter hand out job ids that are unique across all of them"""
+        self.station = station
+        self.workers = workers
+        self.history = history
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = OrderedDict()
+        self._jobs_lock = threading.Lock()
+        self._resource_locks = {}
+        self._ids = ids if ids is not None else itertools.count(1)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self.latest = {"status": "idle", "message": "System Ready", "station": station}
+        self.listeners = []
+
+    def _resource_lock(self, name):
+        with self._jobs_lock:
+            return self._resource_locks.setdefault(name, threading.Lock())
+
+    def _ensure_workers(self):
+        with self._start_lock:
+            while len(self._threads) < self.workers:
+                prefix = f"job-worker-{self.station}-" if self.station else "job-worker-"
+                t = threading.Thread(target=self._worker, name=f"{prefix}{len(self._threads)}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, kind, fn, args=(), resources=(), profile=False):
+        """Queue fn(job, *args); raises QueueFull instead of piling up threads.
+        With profile=True the job runs under a sampling profiler whose stacks land in job.profile_output"""
+        self._ensure_workers()
+        job = Job(next(self._ids), kind, fn, args, resources, self, profile)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+            self._trim()
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._jobs_lock:
+                self._jobs.pop(job.id, None)
+            raise QueueFull(f"{self._queue.qsize()} jobs already waiting")
+        self._publish(job)
+        return job
+
+    def _trim(self):
+        # Forget the oldest finished jobs beyond the history limit
+        excess = len(self._jobs) - self.history
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].finished is not None:
+                del self._jobs[job_id]
+                excess -= 1
+
+    def get(self, job_id):
+        with self._jobs_lock:
+            return self._jobs.get(job_id)
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _publish(self, job):
+        self.latest = {"status": job.status, "message": job.message, "job_id": job.id, "station": self.station}
+        for listener in self.listeners:
+            listener(self.latest)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            # Always lock devices in sorted order so two jobs can never deadlock
+            locks = [self._resource_lock(name) for name in job.resources]
+            for lock in locks:
+                lock.acquire()
+            try:
+                job.state = "running"
+                job.started = time.time()
+                registry.observe('lms_job_wait_seconds', job.started - job.created, kind=job.kind)
+                if job.profile:
+                    with SamplingProfiler() as profiler:
+                        job.fn(job, *job.args)
+                    job.profile_output = profiler.collapsed()
+                else:
+                    job.fn(job, *job.args)
+                job.state = "failed" if job.status == "error" else "done"
+            except Exception as e:
+                job.state = "failed"
+                job.update("error", f"Error: {str(e)}")
+                print(f"Job {job.id} ({job.kind}) error: {e}")
+            finally:
+                job.finished = time.time()
+                registry.observe('lms_job_seconds', job.finished - job.started, kind=job.kind)
+                registry.inc('lms_jobs_total', kind=job.kind, state=job.state)
+                job.done.set()
+                for lock in reversed(locks):
+                    lock.release()
+                self._queue.task_done()
@@ -0,0 +1,173 @@
+# metrics.py
+import bisect
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Bucket bounds in seconds, from single frame operations up to whole checkouts
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """Cumulative-bucket histogram; observe() is a bisect and three additions"""
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    def __init__(self):
+        """Process-wide histograms and counters plus collectors that read gauges at scrape time"""
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._samples = None
+        self.collectors = []
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+            if self._samples is not None:
+                self._samples.append((name, key[1], value))
+
+    def start_sampling(self):
+        """Also keep every raw observation, so exact percentiles can be computed (benchmarks only)"""
+        with self._lock:
+            self._samples = []
+
+    def stop_sampling(self):
+        """Stop keeping raw observations and return [(name, labels, value), ...]"""
+        with self._lock:
+            samples, self._samples = self._samples or [], None
+        return samples
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, stage, name='lms_stage_seconds'):
+        """Time the enclosed block into a histogram labelled with the stage, even if it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, stage=stage)
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            if name in self._help:
+                lines.append(f'# HELP {name} {self._help[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            snapshots = [(key, list(h.counts), h.sum, h.count, h.buckets) for key, h in histograms]
+
+        for (name, labels), counts, total, count, buckets in snapshots:
+            header(name, 'histogram')
+            cumulative = 0
+            for bound, n in zip(buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{_labels(labels + (("le", le),))} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {total:.6f}')
+            lines.append(f'{name}_count{_labels(labels)} {count}')
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f'{name}{_labels(labels)} {value}')
+
+        # Collectors yield (name, type, [(labels dict, value), ...]) read live from the components;
+        # samples of one family are merged so each family is emitted as one contiguous block
+        families = {}
+        for collect in self.collectors:
+            try:
+                collected = collect()
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+                continue
+            for name, kind, samples in collected:
+                families.setdefault(name, (kind, []))[1].extend(samples)
+        for name, (kind, samples) in families.items():
+            header(name, kind)
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(tuple(sorted(labels.items())))} {value}')
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+registry.describe('lms_stage_seconds', 'Duration of one stage of a checkout, return or registration')
+registry.describe('lms_detection_seconds', 'Face detection time per frame, by pipeline step')
+registry.describe('lms_job_wait_seconds', 'Time a hardware job spent queued before a worker picked it up')
+registry.describe('lms_job_seconds', 'Run time of a hardware job once its devices were locked')
+registry.describe('lms_jobs_total', 'Hardware jobs finished, by kind and final state')
+registry.describe('lms_due_events_total', 'Loan reminder and overdue events fired by the due-date scheduler')
+registry.describe('lms_vision_task_seconds', 'Time from handing a frame to the vision pool until its result')
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005, max_depth=40):
+        """Sample one thread's Python stack every interval seconds; use as a context manager on that thread"""
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self._target = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+    def collapsed(self, top=None):
+        """Stacks in collapsed 'frame;frame;frame count' form, ready for flamegraph tools"""
+        return '\n'.join(f'{stack} {count}' for stack, count in self.samples.most_common(top))
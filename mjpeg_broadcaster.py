@@ -0,0 +1,99 @@
+# mjpeg_broadcaster.py
+import threading
+import time
+import cv2
+
+class _Subscriber:
+    def __init__(self, broadcaster):
+        """Single-slot mailbox: a slow client only ever sees the newest frame"""
+        self.broadcaster = broadcaster
+        self._chunk = None
+        self._ready = threading.Event()
+        self.dropped = 0
+
+    def offer(self, chunk):
+        if self._ready.is_set():
+            self.dropped += 1
+        self._chunk = chunk
+        self._ready.set()
+
+    def frames(self, timeout=5.0):
+        """Yield multipart chunks until the client disconnects"""
+        try:
+            while True:
+                if not self._ready.wait(timeout):
+                    continue
+                self._ready.clear()
+                yield self._chunk
+        finally:
+            self.broadcaster.unsubscribe(self)
+
+class MJPEGBroadcaster:
+    def __init__(self, stream, fps=15, size=None, quality=80):
+        """Encode each camera frame to JPEG once and fan the bytes out to every /video_feed client"""
+        self.stream = stream
+        self.fps = fps
+        self.size = size
+        self.quality = quality
+        self._subscribers = set()
+        self._lock = threading.Condition()
+        self._thread = None
+        self.frames_encoded = 0
+
+    def subscribe(self):
+        subscriber = _Subscriber(self)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="mjpeg-broadcaster", daemon=True)
+                self._thread.start()
+            self._lock.notify_all()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def encode(self, frame):
+        if self.size and (frame.shape[1], frame.shape[0]) != tuple(self.size):
+            frame = cv2.resize(frame, tuple(self.size), interpolation=cv2.INTER_AREA)
+        frame_bgr = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        ok, buffer = cv2.imencode('.jpg', frame_bgr, [int(cv2.IMWRITE_JPEG_QUALITY), int(self.quality)])
+        if not ok:
+            return None
+        return b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n'
+
+    def _run(self):
+        seq = None
+        next_due = 0.0
+        while True:
+            # Sleep without touching frames while nobody is watching
+            with self._lock:
+                while not self._subscribers:
+                    self._lock.wait()
+                subscribers = list(self._subscribers)
+
+            entry = self.stream.wait_next(seq)
+            if entry is None:
+                continue
+            seq, _, frame = entry
+
+            now = time.monotonic()
+            if now < next_due:
+                continue
+            next_due = now + 1.0 / self.fps if self.fps else now
+
+            try:
+                chunk = self.encode(frame)
+            except Exception as e:
+                print(f"MJPEG encode error: {e}")
+                continue
+            if chunk is None:
+                continue
+            self.frames_encoded += 1
+            for subscriber in subscribers:
+                subscriber.offer(chunk)
@@ -0,0 +1,79 @@
+# pagination.py
+import base64
+import json
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+def encode_cursor(sort_value, row_id):
+    """Opaque token for the last row of a page"""
+    raw = json.dumps([sort_value, row_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_value, row_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    # Both halves are bound as SQL parameters, so only scalars can get through
+    if (not isinstance(sort_value, (str, int, float, type(None))) or not isinstance(row_id, int)
+            or isinstance(row_id, bool)):
+        raise ValueError("Invalid cursor")
+    return sort_value, row_id
+
+def parse_listing_args(args, sort_fields, default_sort='id'):
+    """Read sort, order, cursor and limit query parameters; raises ValueError on bad input"""
+    sort = args.get('sort', default_sort)
+    if sort not in sort_fields:
+        raise ValueError(f"sort must be one of: {', '.join(sort_fields)}")
+    order = args.get('order', 'asc').lower()
+    if order not in ('asc', 'desc'):
+        raise ValueError("order must be asc or desc")
+    try:
+        limit = int(args.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    limit = max(1, min(limit, MAX_LIMIT))
+    cursor = decode_cursor(args['cursor']) if args.get('cursor') else None
+    return sort, order == 'desc', cursor, limit
+
+def build_keyset_query(columns, from_sql, where, params, sort_expr, id_expr, descending, cursor, limit):
+    """Build a page query that seeks past the cursor instead of using OFFSET.
+    The sort value is selected as the last column so the next cursor can be built from it."""
+    where = list(where)
+    params = list(params)
+    if cursor is not None:
+        op = '<' if descending else '>'
+        # The plain range term lets SQLite seek an expression index such as COALESCE(author, ''), which it
+        # does not do for the row-value comparison alone
+        where.append(f"{sort_expr} {op}= ? AND ({sort_expr}, {id_expr}) {op} (?, ?)")
+        params.extend([cursor[0], *cursor])
+    direction = 'DESC' if descending else 'ASC'
+    sql = f"SELECT {columns}, {sort_expr} FROM {from_sql}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {sort_expr} {direction}, {id_expr} {direction} LIMIT ?"
+    # One extra row tells us whether another page exists
+    params.append(limit + 1)
+    return sql, params
+
+def stream_page(rows, to_item, limit, id_index=0):
+    """Yield {"items": [...], "count": n, "next_cursor": ...} as JSON text, one row at a time"""
+    count = 0
+    last = None
+    more = False
+    try:
+        yield '{"items":['
+        for row in rows:
+            if count == limit:
+                more = True
+                break
+            yield (',' if count else '') + json.dumps(to_item(row))
+            last = row
+            count += 1
+    finally:
+        if hasattr(rows, 'close'):
+            rows.close()
+    next_cursor = encode_cursor(last[-1], last[id_index]) if more else None
+    yield '],"count":%d,"next_cursor":%s}' % (count, json.dumps(next_cursor))
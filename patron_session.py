@@ -0,0 +1,79 @@
+# patron_session.py
+import threading
+import time
+
+def box_overlap(a, b):
+    """Intersection over union of two (top, right, bottom, left) face boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    if bottom <= top or right <= left:
+        return 0.0
+    inter = (bottom - top) * (right - left)
+    area = lambda box: (box[2] - box[0]) * (box[1] - box[3])
+    return inter / float(area(a) + area(b) - inter)
+
+class PatronSession:
+    def __init__(self, user_id, user_name, template, face_location):
+        """A patron identified at a station: their burst template and where their face was last seen"""
+        self.user_id = user_id
+        self.user_name = user_name
+        self.template = template
+        self.face_location = face_location
+        self.started = time.monotonic()
+        self.last_seen = self.started
+        self.reuses = 0
+
+class SessionCache:
+    def __init__(self, ttl=60.0, max_age=600.0):
+        """The patron last identified at each station, reusable by the next RFID scans there while scans
+        keep arriving within ttl seconds of each other; no session outlives max_age"""
+        self.ttl = ttl
+        self.max_age = max_age
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, station_id):
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(station_id)
+            if session is not None and (now - session.last_seen > self.ttl or now - session.started > self.max_age):
+                del self._sessions[station_id]
+                session = None
+            return session
+
+    def start(self, station_id, user_id, user_name, template, face_location):
+        if not self.ttl:
+            return
+        with self._lock:
+            self._sessions[station_id] = PatronSession(user_id, user_name, template, face_location)
+
+    def confirmed(self, station_id, face_location):
+        """The session's patron was seen again at face_location; extend the session"""
+        with self._lock:
+            session = self._sessions.get(station_id)
+            if session is not None:
+                session.face_location = face_location
+                session.last_seen = time.monotonic()
+                session.reuses += 1
+            self.hits += 1
+
+    def reject(self, station_id):
+        """The face in view did not continue the session; the next scan needs a full identification"""
+        with self._lock:
+            self._sessions.pop(station_id, None)
+            self.misses += 1
+
+    def end_user(self, user_id):
+        with self._lock:
+            for station_id in [sid for sid, s in self._sessions.items() if s.user_id == user_id]:
+                del self._sessions[station_id]
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"active": len(self._sessions), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,40 @@
+# queries.py
+# SQL of the request paths, shared by the application and the query plan check in database_setup.py
+
+ISSUE_LOOKUP = 'SELECT book_id, title, status FROM books WHERE rfid_tag=?'
+
+RETURN_LOOKUP = '''SELECT t.transaction_id, t.book_id, b.title, u.name, u.face_encoding
+                   FROM transactions t
+                   JOIN books b ON t.book_id=b.book_id
+                   JOIN users u ON t.user_id=u.user_id
+                   WHERE t.rfid_tag=? AND t.status='issued' '''
+
+USER_ACTIVE_COUNT = "SELECT COUNT(*) FROM transactions WHERE user_id=? AND status='issued'"
+
+ACTIVE_TRANSACTIONS = '''SELECT t.transaction_id, b.title, u.name, t.issue_date, t.due_date, t.overdue
+                         FROM transactions t JOIN books b ON t.book_id=b.book_id JOIN users u ON t.user_id=u.user_id
+                         WHERE t.status='issued' ORDER BY t.due_date'''
+
+GALLERY_LOAD = 'SELECT user_id, name, face_encoding FROM users WHERE is_active=1'
+
+# Range scan on idx_transactions_status_due; loans due before the cursor were already handled
+DUE_LOAD = "SELECT transaction_id, due_date FROM transactions WHERE status='issued' AND due_date > ?"
+
+def issue_batch_lookup(count):
+    """Lookup of a batch of scanned tags in one statement"""
+    return f'SELECT book_id, title, status, rfid_tag FROM books WHERE rfid_tag IN ({",".join("?" * count)})'
+
+# Listings as (columns, tables, id column, base conditions) for build_keyset_query
+BOOK_LISTING = ('b.book_id, b.title, b.author, b.category, b.status', 'books b', 'b.book_id', [])
+USER_LISTING = ('u.user_id, u.name, u.email, u.phone', 'users u', 'u.user_id', ['u.is_active=1'])
+TRANSACTION_LISTING = ('t.transaction_id, b.title, u.name, t.issue_date, t.due_date, t.return_date, t.status',
+                       'transactions t JOIN books b ON t.book_id=b.book_id JOIN users u ON t.user_id=u.user_id',
+                       't.transaction_id', [])
+
+# Sortable columns per listing; nullable columns are coalesced so keyset comparisons stay total.
+# Every expression has a matching (expression, id) index from migration 7
+BOOK_SORTS = {'id': 'b.book_id', 'title': 'b.title', 'author': "COALESCE(b.author, '')",
+              'category': "COALESCE(b.category, '')", 'status': 'b.status'}
+USER_SORTS = {'id': 'u.user_id', 'name': 'u.name', 'email': "COALESCE(u.email, '')"}
+TRANSACTION_SORTS = {'id': 't.transaction_id', 'issue_date': 't.issue_date', 'due_date': 't.due_date',
+                     'return_date': "COALESCE(t.return_date, '')"}
@@ -0,0 +1,44 @@
+# query_cache.py
+import threading
+from collections import OrderedDict
+
+class QueryCache:
+    def __init__(self, max_entries=256):
+        """Thread-safe LRU cache of query results, dropped wholesale whenever the underlying table changes"""
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def generation(self):
+        return self._generation
+
+    def put(self, key, value, generation):
+        """Store a result computed at the given generation; stale results from before a write are ignored"""
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,92 @@
+# station.py
+import os
+import threading
+import time
+from drivers import make_camera, make_rfid_reader
+from job_scheduler import JobScheduler
+
+class Components:
+    def __init__(self, names, label=None):
+        """Named parts of the system started in background threads, with their state for readiness checks"""
+        self.names = tuple(names)
+        self.label = label
+        self.state = {name: {"state": "pending"} for name in self.names}
+        self._done = {name: threading.Event() for name in self.names}
+
+    def _qualified(self, name):
+        return f"{self.label}/{name}" if self.label else name
+
+    def start(self, name, init):
+        threading.Thread(target=self._run, args=(name, init), name=f"init-{self._qualified(name)}", daemon=True).start()
+
+    def _run(self, name, init):
+        self.state[name] = {"state": "starting"}
+        start = time.perf_counter()
+        try:
+            init()
+            self.state[name] = {"state": "ready", "seconds": round(time.perf_counter() - start, 3)}
+        except Exception as e:
+            self.state[name] = {"state": "failed", "error": str(e)}
+            print(f"Startup of {self._qualified(name)} failed: {e}")
+        finally:
+            self._done[name].set()
+
+    def is_ready(self, *names):
+        return all(self.state[name]["state"] == "ready" for name in (names or self.names))
+
+    def wait_ready(self, *names, timeout=None):
+        """Block until the named components (default: all) finished starting; True if all came up"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for name in names or self.names:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            self._done[name].wait(remaining)
+        return self.is_ready(*names)
+
+class Station:
+    def __init__(self, station_id, camera=None, rfid_reader=None, video_options=None, job_ids=None,
+                 workers=2, max_queue=16, vision_pool=None, archiver=None):
+        """One checkout desk with its own camera, RFID reader and job lane; gallery, database and caches are
+        shared through LibraryManagementSystem. Drivers default to LMS_CAMERA_<ID> / LMS_RFID_<ID>, then
+        LMS_CAMERA / LMS_RFID"""
+        self.id = station_id
+        self._camera_driver = camera
+        self._rfid_driver = rfid_reader
+        self.video_options = video_options or {}
+        self.vision_pool = vision_pool
+        self.archiver = archiver
+        self.scheduler = JobScheduler(workers=workers, max_queue=max_queue, ids=job_ids, station=station_id)
+        self.face_system = None
+        self.rfid_reader = None
+        self.broadcaster = None
+        self.components = Components(('camera', 'rfid'), label=station_id)
+        self._started = False
+
+    def _env_spec(self, kind):
+        return os.environ.get(f'LMS_{kind}_{self.id.upper()}')
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        self.components.start('camera', self._init_camera)
+        self.components.start('rfid', self._init_rfid)
+
+    def _init_camera(self):
+        from face_recognition_module import FaceRecognitionSystem
+        from mjpeg_broadcaster import MJPEGBroadcaster
+        camera = self._camera_driver if self._camera_driver is not None else make_camera(self._env_spec('CAMERA'))
+        face_system = FaceRecognitionSystem(camera=camera, vision_pool=self.vision_pool, archiver=self.archiver)
+        self.broadcaster = MJPEGBroadcaster(face_system.stream, **self.video_options)
+        self.face_system = face_system
+
+    def _init_rfid(self):
+        self.rfid_reader = self._rfid_driver if self._rfid_driver is not None else make_rfid_reader(self._env_spec('RFID'))
+
+    def to_dict(self):
+        return {
+            "station_id": self.id,
+            "ready": self.components.is_ready(),
+            "components": self.components.state,
+            "queue_depth": self.scheduler.queue_depth,
+            "status": self.scheduler.latest,
+        }
@@ -0,0 +1,64 @@
+# status_stream.py
+import json
+import threading
+from collections import deque
+
+class StatusBroadcaster:
+    def __init__(self, history=256):
+        """Shared, numbered log of status transitions served to any number of SSE clients"""
+        self._log = deque(maxlen=history)
+        # Newest event per station, so a new client starts from the current state of every station
+        self._latest = {}
+        self._next_id = 1
+        self._cond = threading.Condition()
+
+    def publish(self, data):
+        with self._cond:
+            entry = (self._next_id, dict(data))
+            self._log.append(entry)
+            self._latest[entry[1].get('station')] = entry
+            self._next_id += 1
+            self._cond.notify_all()
+
+    @property
+    def last_id(self):
+        return self._next_id - 1
+
+    def _format(self, event_id, data, event="status"):
+        return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def stream(self, last_event_id=None, heartbeat=15.0):
+        """Yield SSE messages after last_event_id, or the current state of every station first for a new
+        client; each client only holds a cursor into the shared log, so a slow client falls behind and is
+        resynced to the latest state instead of buffering"""
+        with self._cond:
+            cursor = self.last_id if last_event_id is None else last_event_id
+            current = sorted(self._latest.values(), key=lambda e: e[0]) if last_event_id is None else []
+            if cursor > self.last_id:
+                # Ids restart at 1 with the server, so a client ahead of the log missed everything since
+                cursor = -1 if self._log else 0
+        yield "retry: 2000\n\n"
+        for event_id, data in current:
+            yield self._format(event_id, data)
+        while True:
+            with self._cond:
+                if self.last_id <= cursor:
+                    self._cond.wait(heartbeat)
+                if self.last_id <= cursor:
+                    pending = None
+                else:
+                    oldest = self._log[0][0]
+                    missed = cursor < oldest - 1
+                    pending = [self._log[-1]] if missed else [e for e in self._log if e[0] > cursor]
+
+            if pending is None:
+                yield ": keepalive\n\n"
+                continue
+            if missed:
+                event_id, data = pending[0]
+                cursor = event_id
+                yield self._format(event_id, data, event="resync")
+                continue
+            for event_id, data in pending:
+                cursor = event_id
+                yield self._format(event_id, data)
@@ -0,0 +1,6 @@
+# test_query_plans.py
+from database_setup import check_query_plans
+
+def test_hot_queries_use_indexes():
+    # Seeds the synthetic dataset in memory; same check as 'python database_setup.py check-plans'
+    assert check_query_plans() == []
@@ -0,0 +1,126 @@
+# vision_pool.py
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+import numpy as np
+from metrics import registry
+
+# Worker-process state: dlib models load once per worker and shared frame slots are attached once
+_face_recognition = None
+_attached = {}
+# Slots that grew for a larger camera leave stale attachments behind; keep only the most recent ones
+_MAX_ATTACHED = 64
+
+def _init_worker():
+    global _face_recognition
+    import face_recognition
+    blank = np.zeros((160, 160, 3), np.uint8)
+    face_recognition.face_locations(blank)
+    face_recognition.face_encodings(blank, [(20, 140, 140, 20)])
+    _face_recognition = face_recognition
+
+def _frame(slot, shape, dtype):
+    segment = _attached.get(slot)
+    if segment is None:
+        if len(_attached) >= _MAX_ATTACHED:
+            _attached.pop(next(iter(_attached))).close()
+        segment = _attached[slot] = shared_memory.SharedMemory(name=slot)
+    return np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+
+def _face_locations(slot, shape, dtype, model, upsample):
+    return _face_recognition.face_locations(_frame(slot, shape, dtype), number_of_times_to_upsample=upsample,
+                                            model=model)
+
+def _face_encodings(slot, shape, dtype, locations, num_jitters):
+    return _face_recognition.face_encodings(_frame(slot, shape, dtype), locations, num_jitters=num_jitters)
+
+def _face_landmarks(slot, shape, dtype, locations, model):
+    return _face_recognition.face_landmarks(_frame(slot, shape, dtype), locations, model=model)
+
+def _warmup():
+    return os.getpid()
+
+class VisionPool:
+    def __init__(self, workers=None, slots=None, slot_bytes=640 * 480 * 3, start_method='spawn'):
+        """Warm worker processes with preloaded dlib models; frames travel through reusable shared-memory
+        slots instead of being pickled, and every call returns a concurrent.futures.Future. Slots start at
+        slot_bytes and grow to fit larger frames"""
+        self.workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        self.slot_bytes = slot_bytes
+        # spawn, not fork: the parent already runs camera, audit and web threads
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                             mp_context=multiprocessing.get_context(start_method))
+        self._segments = [shared_memory.SharedMemory(create=True, size=slot_bytes)
+                          for _ in range(slots or self.workers * 4)]
+        self._segments_lock = threading.Lock()
+        self._free = queue.Queue()
+        for segment in self._segments:
+            self._free.put(segment)
+        self._closed = False
+        atexit.register(self.close)
+
+    def warm(self, timeout=None):
+        """Start every worker now so model loading happens at boot rather than on the first checkout"""
+        done, pending = wait([self._executor.submit(_warmup) for _ in range(self.workers)], timeout=timeout)
+        for future in done:
+            future.result()
+        if pending:
+            raise TimeoutError(f"{len(pending)} vision workers still starting")
+
+    @property
+    def in_flight(self):
+        return len(self._segments) - self._free.qsize()
+
+    def _grow(self, segment, size):
+        """Replace a slot that is too small for this camera's frames; later frames of that size reuse it"""
+        grown = shared_memory.SharedMemory(create=True, size=size)
+        with self._segments_lock:
+            self._segments[self._segments.index(segment)] = grown
+        segment.close()
+        segment.unlink()
+        return grown
+
+    def _submit(self, task, fn, frame, *args):
+        frame = np.asarray(frame)
+        # Waiting for a free slot is the backpressure when more frames are queued than workers can take
+        segment = self._free.get()
+        try:
+            if frame.nbytes > segment.size:
+                segment = self._grow(segment, frame.nbytes)
+            np.ndarray(frame.shape, dtype=frame.dtype, buffer=segment.buf)[...] = frame
+            start = time.perf_counter()
+            future = self._executor.submit(fn, segment.name, frame.shape, frame.dtype.str, *args)
+        except Exception:
+            self._free.put(segment)
+            raise
+
+        def release(_):
+            registry.observe('lms_vision_task_seconds', time.perf_counter() - start, task=task)
+            self._free.put(segment)
+        future.add_done_callback(release)
+        return future
+
+    def face_locations(self, rgb_image, model='hog', upsample=1):
+        return self._submit('face_locations', _face_locations, rgb_image, model, upsample)
+
+    def face_encodings(self, rgb_image, locations, num_jitters=1):
+        return self._submit('face_encodings', _face_encodings, rgb_image, list(locations), num_jitters)
+
+    def face_landmarks(self, rgb_image, locations, model='large'):
+        return self._submit('face_landmarks', _face_landmarks, rgb_image, list(locations), model)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        with self._segments_lock:
+            segments = list(self._segments)
+        for segment in segments:
+            segment.close()
+            segment.unlink()